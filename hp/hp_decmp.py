@@ -2,83 +2,147 @@
 
 from sys import argv, exit
 import os.path as path
+import sys
 import csv
+import heapq
+import struct
+
+import numpy as np
+
+sys.path.append(path.join(path.dirname(path.abspath(__file__)), '..', 'tools'))
+from romimage import RomImage, absp
 
 #NUM_LANGUAGES = 10
 NUM_LANGUAGES = 2
 NUM_STRINGS = 3796
 
-def absp(bank, memory):
-   return (bank*0x4000)+memory-0x4000 
-
-def relp(address):
-    return (address // 0x4000, 0x4000 + address % 0x4000)
-
-class NotPointerException(ValueError): pass
-
-def readpointer(bank=None):
-    if not bank: bank = rom.tell()/0x4000
-    s = readshort()
-    if 0x4000 > s or 0x8000 <= s:
-        raise NotPointerException(s)
-    return (bank * 0x4000) + (s - 0x4000)
+def decode_table(key):
+    # Expands the key tree into a table indexed by (node << 8) | byte, so
+    # strings decode a whole byte at a time.  Bits are read LSB first; each
+    # entry has the characters the byte's bits finish, whether the string
+    # ends within them, and the node the next byte starts from.  All nodes
+    # and bytes are walked at once, a bit at a time.
+    key = np.frombuffer(key, dtype=np.uint8)
+    nodes = max(1, len(key) // 2)
+    node = np.repeat(np.arange(nodes), 256)
+    byte = np.tile(np.arange(256), nodes)
+    out = np.zeros((len(node), 8), dtype=np.uint8)
+    count = np.zeros(len(node), dtype=np.int64)
+    done = np.zeros(len(node), dtype=bool)
+    rows = np.arange(len(node))
+    for bit in range(8):
+        step = key[np.minimum((node << 1) + ((byte >> bit) & 1), len(key) - 1)]
+        leaf = ~done & (step & 0x80 != 0)
+        end = leaf & (step & 0x7f == 0x7f)
+        emit = leaf & ~end
+        out[rows[emit], count[emit]] = step[emit] & 0x7f
+        count += emit
+        done |= end
+        node = np.where(done, node, np.where(leaf, 0, step))
+    chars = [bytes(o[:c]).decode('latin-1') for o, c in zip(out.tolist(), count.tolist())]
+    return chars, done.tolist(), node.tolist()
 
-def readbyte():
-    return ord(rom.read(1))
+def decompress_string(data, address, table=None):
+    # Decodes the string at address in data, compressed with table from
+    # decode_table, or plain text up to the 7F/FF terminator if table is None.
+    # Returns the string and the address just past it.
+    if table is None:
+        end = address
+        while data[end] & 0x7f != 0x7f:
+            end += 1
+        return bytes(data[address:end]).decode('latin-1'), end + 1
+    chars, ends, nexts = table
+    string = []
+    node = 0
+    end = address
+    for byte in data[address:]:
+        i = (node << 8) | byte
+        string.append(chars[i])
+        end += 1
+        if ends[i]:
+            break
+        node = nexts[i]
+    return "".join(string), end
 
-def readshort():
-    return readbyte() + (readbyte() << 8)
+def build_key(counts):
+    # An optimal Huffman tree for {character: count} (the 7F terminator
+    # included), laid out as the game's key: node n's children at 2n and
+    # 2n+1, root first, leaves as 80|char.  Also returns each character's
+    # code as (bits, length), first bit in bit 0.
+    counts = dict(counts)
+    if len(counts) < 2:
+        # The root needs two children.
+        counts.setdefault(0x20, 0)
+        counts.setdefault(0x21, 0)
+    heap = [(n, c, c) for c, n in sorted(counts.items())]
+    heapq.heapify(heap)
+    serial = 0x80
+    while len(heap) > 1:
+        a = heapq.heappop(heap)
+        b = heapq.heappop(heap)
+        heapq.heappush(heap, (a[0] + b[0], serial, (a[2], b[2])))
+        serial += 1
+    nodes = [heap[0][2]]
+    key = []
+    codes = {}
+    paths = [(0, 0)]
+    for n, node in enumerate(nodes):
+        bits, length = paths[n]
+        for bit, child in enumerate(node):
+            code = (bits | (bit << length), length + 1)
+            if isinstance(child, tuple):
+                key.append(len(nodes))
+                nodes.append(child)
+                paths.append(code)
+            else:
+                key.append(0x80 | child)
+                codes[child] = code
+    if len(nodes) > 0x7f:
+        exit("Too many characters for the key ({} nodes).".format(len(nodes)))
+    return bytes([len(nodes)] + key), codes
 
-def writebyte(byte):
-    rom.write(bytes([byte]))
+def compress_string(text, codes):
+    # text is bytes without the terminator; bits are packed LSB first.
+    acc = 0
+    n = 0
+    for c in text + b'\x7f':
+        bits, length = codes[c]
+        acc |= bits << n
+        n += length
+    return acc.to_bytes((n + 7) // 8, 'little')
 
-def writeshort(short):
-    writebyte(short & 0xff)
-    writebyte(short >> 8)
+def encode_text(string):
+    string = string.replace('’', "'").replace('…', '...')
+    try:
+        text = string.encode('ascii')
+    except UnicodeEncodeError:
+        print(f"Warning: string contains non-ASCII: {string}")
+        text = string.encode('ascii', 'replace')
+    return text.replace(b'\x7f', b'?')
 
-def decompress_string(address, compressed=True):
-    rom.seek(address)
-    if not compressed:
-        string = ""
-        byte = readbyte()
-        if byte & 0x7f == 0x7f:
-            return string
+def pack(sizes, capacities):
+    # First-fit decreasing: the biggest item goes first, each into the first
+    # bin with room.  Returns (bin, offset) per item, or None if they don't fit.
+    free = list(capacities)
+    placed = [None] * len(sizes)
+    for i in sorted(range(len(sizes)), key=lambda i: -sizes[i]):
+        for b in range(len(free)):
+            if sizes[i] <= free[b]:
+                placed[i] = (b, capacities[b] - free[b])
+                free[b] -= sizes[i]
+                break
         else:
-            string += chr(byte)
-        
-    else:
-        curbit = 8
-        curbyte = -1
-        def readbit():
-            nonlocal curbit, curbyte
-            if curbit >= 8:
-                curbyte = readbyte()
-            curbit = curbit & 7
-            out = curbyte & (1<<curbit)
-            curbit += 1
-            return bool(out)
-        
-        string = ""
-        keyptr = 0
-        while True:
-            bit = readbit()
-            keyptr = key[(keyptr << 1) + bit]
-            if keyptr & 0x80:
-                char = keyptr & 0x7f
-                if char == 0x7f:
-                    return string
-                else:
-                    string += chr(char)
-                    keyptr = 0
-        
+            return None
+    return placed
 
 language_strings = []
+language_extents = []
 
 if __name__ == "__main__":
     if len(argv) < 3 or argv[2] not in ("extract", "insert"):
         exit("usage: hp_decmp.py rom.gbc (extract|insert)")
     command = argv[2]
-    rom = open(argv[1], 'r+b')
+    rom = RomImage(argv[1], writable=True)
     rom.seek(0x134)
     name = rom.read(11)
     #if name == b"HARRYPOTTER":
@@ -112,26 +176,31 @@ if __name__ == "__main__":
         
         keyaddress = absp(lang_bank, 0x6c7d)
         rom.seek(keyaddress)
-        key_length = readbyte()*2
+        key_length = rom.readbyte()*2
         key = rom.read(key_length) #0xa4)
+        table = decode_table(key) if compressed else None
+        data = rom.view(0)
         
-        rom.seek(absp(lang_bank, 0x4001))
         string_addresses = []
-        for i in range(NUM_STRINGS):
-            bankoffset = readbyte()
-            address = readshort()
+        for bankoffset, address in rom.iter_unpack("<BH", absp(lang_bank, 0x4001), NUM_STRINGS):
             string_addresses.append(absp(lang_bank+bankoffset, 0x4000+address))
             
         strings = []
+        extents = {}
         for i, address in enumerate(string_addresses):
             #print(hex(address))
-            string = decompress_string(address, compressed=compressed)
+            string, end = decompress_string(data, address, table)
             strings.append(string)
+            # The space each bank's text takes up, for reinserting into.
+            bank = address // 0x4000
+            start, stop = extents.get(bank, (address, end))
+            extents[bank] = (min(start, address), max(stop, end))
             if i == 1:
                 #print(f" (Language: {string})")
                 print("Reading language:", string)
             #print(hex(address), hex(rom.tell()), string)
         language_strings.append(strings)
+        language_extents.append(extents)
     
     if command == "extract":
         print("Done, outputting hp2.csv")
@@ -148,16 +217,16 @@ if __name__ == "__main__":
                     string = language_strings[1][i]
                 writer.writerow([i, string, ""])
     elif command == "insert":
-        if compressed:
-            exit("Can only insert in custom ROM.")
         f = open("hp2.csv", "r")
         reader = csv.reader(f)
         new_strings = []
         next(reader)
-        for row in reader:
+        for i, row in enumerate(reader):
             string = row[2]
             if not string.strip():
-                string = row[1]
+                # Untranslated: put back what language 0 had, which may be
+                # "&" (use language 1's) rather than the text extract showed.
+                string = language_strings[0][i] if i < len(language_strings[0]) else row[1]
             new_strings.append(string)
         
         if len(new_strings) != NUM_STRINGS:
@@ -165,32 +234,95 @@ if __name__ == "__main__":
         
         lang_bank = lang_banks[0]
         
-        #rom.seek(absp(lang_bank, 0x4001))
-        starting_bank = lang_bank + 2 # + readbyte() + 2
-        starting_address = 0x4000 #readshort()
+        if compressed:
+            # Recompress with a key made for the new text, and pack the
+            # strings into the space the old ones took up.
+            if len(new_strings) != NUM_STRINGS:
+                exit("The pointer table has room for exactly {} strings.".format(NUM_STRINGS))
+            texts = [encode_text(string) for string in new_strings]
+            counts = {0x7f: len(texts)}
+            for text in texts:
+                for c in text:
+                    counts[c] = counts.get(c, 0) + 1
+            key, codes = build_key(counts)
+            keyaddress = absp(lang_bank, 0x6c7d)
+            
+            extents = language_extents[0]
+            banks = sorted(extents)
+            starts = [keyaddress + len(key) if bank == lang_bank else extents[bank][0] for bank in banks]
+            capacities = [max(0, extents[bank][1] - start) for bank, start in zip(banks, starts)]
+            
+            # Identical strings are stored once.
+            unique = {}
+            for text in texts:
+                if text not in unique:
+                    unique[text] = compress_string(text, codes)
+            blobs = list(unique.values())
+            placed = pack([len(blob) for blob in blobs], capacities)
+            if placed is None:
+                exit("New text doesn't fit: {} bytes for {} bytes of space.".format(
+                    sum(len(blob) for blob in blobs), sum(capacities)))
+            
+            # Everything is written to a copy of the text area first, from
+            # the pointer table to the end of the last string, and only goes
+            # into the ROM once it has been read back successfully.
+            tableaddress = absp(lang_bank, 0x4001)
+            base = tableaddress
+            region = bytearray(data[base:max(stop for start, stop in extents.values())])
+            def put(address, blob):
+                region[address-base:address-base+len(blob)] = blob
+            
+            put(keyaddress, key)
+            for start, capacity in zip(starts, capacities):
+                put(start, b'\xff' * capacity)
+            where = {}
+            for text, blob, (b, offset) in zip(unique, blobs, placed):
+                put(starts[b] + offset, blob)
+                where[text] = starts[b] + offset
+            pointers = bytearray()
+            for text in texts:
+                bank, pointer = divmod(where[text], 0x4000)
+                pointers += struct.pack("<BH", bank - lang_bank, pointer)
+            put(tableaddress, pointers)
+            
+            # Read it all back the way extract does.
+            view = memoryview(region)
+            table = decode_table(bytes(view[keyaddress-base+1:keyaddress-base+1+view[keyaddress-base]*2]))
+            for i, ((bankoffset, address), text) in enumerate(zip(
+                    struct.iter_unpack("<BH", view[tableaddress-base:tableaddress-base+3*len(texts)]), texts)):
+                address = absp(lang_bank+bankoffset, 0x4000+address) - base
+                string, end = decompress_string(view, address, table)
+                if string.encode('latin-1') != text or bytes(view[address:end]) != unique[text]:
+                    exit(f"Verification failed at string {i}: {string!r}; the ROM was not changed.")
+            view.release()
+            
+            rom.seek(base)
+            rom.write(region)
+            
+            used = sum(len(blob) for blob in blobs)
+            print(f"Done, {used} of {sum(capacities)} bytes used in {len(banks)} banks, verified.")
+        else:
+            #rom.seek(absp(lang_bank, 0x4001))
+            starting_bank = lang_bank + 2 # + readbyte() + 2
+            starting_address = 0x4000 #readshort()
         
-        new_offsets = []
-        rom.seek(absp(starting_bank, starting_address))
-        numbanks = 0
-        for string in new_strings:
-            if ((rom.tell()%0x4000) + len(string) + 1) > 0x4000:
-                numbanks += 1
-                rom.write(b'\xff'* (0x4000 - (rom.tell() % 0x4000)))
-            bank_offset = (rom.tell() // 0x4000) - lang_bank
-            offset = rom.tell() % 0x4000 + 0x4000
-            new_offsets.append((bank_offset, offset))
-            string = string.replace('’', "'").replace('…', '...')
-            try:
-                rom.write(string.encode('ascii'))
-            except UnicodeEncodeError:
-                print(f"Warning: string contains non-ASCII: {string}")
-                rom.write(string.encode('ascii', 'replace'))
-            writebyte(0xff)
+            new_offsets = []
+            rom.seek(absp(starting_bank, starting_address))
+            numbanks = 0
+            for string in new_strings:
+                if ((rom.tell()%0x4000) + len(string) + 1) > 0x4000:
+                    numbanks += 1
+                    rom.write(b'\xff'* (0x4000 - (rom.tell() % 0x4000)))
+                bank_offset = (rom.tell() // 0x4000) - lang_bank
+                offset = rom.tell() % 0x4000 + 0x4000
+                new_offsets.append((bank_offset, offset))
+                rom.write(encode_text(string))
+                rom.writebyte(0xff)
         
-        rom.seek(absp(lang_bank, 0x4001))
-        for bank_offset, offset in new_offsets:
-            writebyte(bank_offset)
-            writeshort(offset)
+            rom.seek(absp(lang_bank, 0x4001))
+            for bank_offset, offset in new_offsets:
+                rom.writebyte(bank_offset)
+                rom.writeshort(offset)
     
-        print(f"Done, wrote {numbanks} banks of new text.")
+            print(f"Done, wrote {numbanks} banks of new text.")
         
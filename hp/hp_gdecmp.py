@@ -1,10 +1,7 @@
 from hp_decmp import *
-import struct
 
 def readbyte():
-    return ord(rom.read(1))
-def readshort():
-    return struct.unpack("<H", rom.read(2))[0]
+    return rom.readbyte()
 
 class GraphicsDecompressedException(Exception): pass
 class InvalidGraphicsError(Exception): pass
@@ -62,14 +59,12 @@ def decomp():
     return
 
 if __name__ == "__main__":
-    rom = open(argv[1], 'rb')
+    rom = RomImage(argv[1])
     rom.seek(0x134)
     name = rom.read(11)
     offsets = []
     if name == b"HPCOSECRETS":
-        rom.seek(absp(0x09, 0x5000))
-        for i in range(0x800):
-            bank, offset = readbyte(), readshort()
+        for bank, offset in rom.iter_unpack("<BH", absp(0x09, 0x5000), 0x800):
             print(hex(bank), hex(offset))
             offsets.append(absp(bank, offset))
         #offset = absp(0xa4, 0x5eb5)
@@ -1,5 +1,10 @@
 #!/usr/bin/python3
 
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'tools'))
+from romimage import RomImage, NotPointerException
+
 MAP_NAMES = """Diagon Alley
 Cauldron Shop
 Apothecary
@@ -97,22 +102,8 @@ Card Vault
 Binns' Office
 Empty Class""".split('\n')
 
-rom = open("hp1.gbc", "rb")
-
-class NotPointerException(ValueError): pass
-
-def readpointer(bank=None):
-    if not bank: bank = rom.tell()/0x4000
-    s = readshort()
-    if 0x4000 > s or 0x8000 <= s:
-        raise NotPointerException(s)
-    return (bank * 0x4000) + (s - 0x4000)
-
-def readshort():
-    return readbyte() + (readbyte() << 8)
-
-def readbyte():
-    return ord(rom.read(1))
+rom = RomImage("hp1.gbc")
+readbyte, readshort, readpointer = rom.readbyte, rom.readshort, rom.readpointer
 
 map_groups = []
 for i, map_name in enumerate(MAP_NAMES):
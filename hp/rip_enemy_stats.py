@@ -1,32 +1,14 @@
 #!/usr/bin/python3
 
-rom = open("hp1.gbc", "rb")
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'tools'))
+from romimage import RomImage
 
-class NotPointerException(ValueError): pass
+rom = RomImage("hp1.gbc")
 
-def readpointer(bank=None):
-    if not bank: bank = rom.tell()/0x4000
-    s = readshort()
-    if 0x4000 > s or 0x8000 <= s:
-        raise NotPointerException(s)
-    return (bank * 0x4000) + (s - 0x4000)
-
-def readshort():
-    return readbyte() + (readbyte() << 8)
-
-def readbyte():
-    return ord(rom.read(1))
-
-rom.seek(0x4000*3 + 0x1c1f)
-enemies = []
-for i in range(61):
-    enemy = []
-    enemy.append(readbyte())
-    enemy.append(readshort())
-    enemy.append(readshort())
-    for j in range(0x15-5):
-        enemy.append(readbyte())
-    enemies.append(enemy)
+# byte, HP, MP, then 0x15-5 single-byte stats
+enemies = [list(enemy) for enemy in rom.iter_unpack("<BHH16B", 0x4000*3 + 0x1c1f, 61)]
 
 
 with open("enemies.html", "w") as out:
@@ -1,3 +1,8 @@
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'tools'))
+from romimage import RomImage, NotPointerException
+
 PRINT_SCRIPTS = True
 PRINT_SCRIPT_SYMBOLS = False
 MAP_COUNT = 122
@@ -7,22 +12,8 @@ SPELL_STRINGS = 2847
 ITEM_STRINGS = 1875
 CARD_STRINGS = 2132
 
-rom = open("hp2.gbc", "rb")
-
-class NotPointerException(ValueError): pass
-
-def readpointer(bank=None):
-    if not bank: bank = rom.tell()/0x4000
-    s = readshort()
-    if 0x4000 > s or 0x8000 <= s:
-        raise NotPointerException(s)
-    return (bank * 0x4000) + (s - 0x4000)
-
-def readshort():
-    return readbyte() + (readbyte() << 8)
-
-def readbyte():
-    return ord(rom.read(1))
+rom = RomImage("hp2.gbc")
+readbyte, readshort, readpointer = rom.readbyte, rom.readshort, rom.readpointer
 
 COMMANDS = {
     0x00: "END",
@@ -1,28 +1,11 @@
-# I hate
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'tools'))
+from romimage import RomImage
 
-def readpointer(bank=None):
-    if not bank: bank = rom.tell()/0x4000
-    s = readshort()
-    if 0x4000 > s or 0x8000 <= s:
-        raise NotPointerException(s)
-    return (bank * 0x4000) + (s - 0x4000)
+rom = RomImage("hp1.gbc")
 
-def readshort():
-    return readbyte() + (readbyte() << 8)
-
-def readbyte():
-    return ord(rom.read(1))
-
-rom = open("hp1.gbc", "rb")
-
-rom.seek(0x4000 * 4 + 0x18b9)
-for i in range(0x50):
-    bank = readbyte()
-    enter = readshort()
-    init = readshort()
-    state = readshort()
-    leave = readshort()
-    
+for i, (bank, enter, init, state, leave) in enumerate(rom.iter_unpack("<BHHHH", 0x4000 * 4 + 0x18b9, 0x50)):
     print(f"; State {i:02x}: ")
     print(f"{bank:02x}:{enter:04x} State{i:02x}Enter")
     print(f"{bank:02x}:{init:04x} State{i:02x}Init")
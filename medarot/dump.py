@@ -1,20 +1,12 @@
 #!/bin/python
 
-rom = open("medarot1.gb", "rb")
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'tools'))
+from romimage import RomImage, NotPointerException
 
-class NotPointerException(ValueError): pass
-
-def readpointer(bank):
-    s = readshort()
-    if 0x4000 > s or 0x8000 <= s:
-        raise NotPointerException(s)
-    return (bank * 0x4000) + (s - 0x4000)
-
-def readshort():
-    return readbyte() + (readbyte() << 8)
-
-def readbyte():
-    return ord(rom.read(1))
+rom = RomImage("medarot1.gb")
+readbyte, readshort, readpointer = rom.readbyte, rom.readshort, rom.readpointer
 
 table = {}
 for line in open("medarot1.tbl").readlines():
@@ -2,136 +2,73 @@
 
 # 
 
-import struct
 import os
 import sys
-import math
 
-def readshort():
-    return struct.unpack("<H", rom.read(2))[0]
-    
-def readbyte():
-    return struct.unpack("<B", rom.read(1))[0]
-    
-def abspointer(bank, offset):
-    return bank*0x4000+offset-0x4000
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'tools'))
+from romimage import RomImage, absp
+import tiles
 
 def readfarpointers(offset, amount=151):
-    rom.seek(offset)
     pointers = []
-    for i in range(amount):
-        offset = readshort()
-        bank = readbyte()
+    for offset, bank in rom.iter_unpack("<HB", offset, amount):
         assert 0x3fff < offset < 0x8000
-        pointers.append((offset - 0x4000) + 0x4000 * bank)
+        pointers.append(absp(bank, offset))
     return pointers
 
-def readtiles(amount):
-    tiles = []
-    tile = []
-
-    for i in range(amount*8*4):
-        high = readbyte()
-        low = readbyte()
-        #print(hex(i), hex(s), high, low)
-        for i in range(8)[::-1]:
-            h = (high >> i) & 0b1
-            l = (low >> i) & 0b1
-            pixel = (l*2+h)
-            tile.append(pixel)
-        if len(tile)==8*8:
-            tiles.append(tile)
-            tile = []
-    #print(len(tiles))
-    #raise
-    return tiles
-
-def readcolor():
-    s = readshort()
-    blue = (s >> 10)
-    green = (s >> 5) % 32
-    red = (s) % 32
-    return (red, green, blue)
-
-def readpalette():
-    pal = []
-    for i in range(4):
-        pal.append(readcolor())
-    return pal
-    
-def createppm(tiles, width=6, height=4):
-    ppm = """P6
-{0} {1}
-255
-""".format(width*8, height*8).encode("ascii")
-    for row in range(height*8):
-        for col in range(width*8):
-            #print("{}x{} [{}][{}] - ".format(row,col, (width)*(row//8)+(col//8), 8*(row%8)+(col%8)), end="")
-            try:
-                r, g, b = tiles[(width)*(row//8)+(col//8)][8*(row%8)+(col%8)]
-                ppm += struct.pack("BBB", r*8, g*8, b*8)
-            except IndexError:
-                raise
-    return ppm
+SPRITE_WIDTH = 6
+SPRITE_HEIGHT = 4
+SPRITE_TILES = SPRITE_WIDTH*SPRITE_HEIGHT
+
+# Shades of gray, as BGR555.
+SILHOUETTE_PALETTE = tiles.palettes(np.array([0x7fff, 0x5294, 0x2108, 0x0000], dtype='<u2'))
+
+def readblocks(pointers, size):
+    return b''.join(rom.view(pointer, size) for pointer in pointers)
+
+def render(pixels, selects, palettes):
+    # RGB images from (n, h, w) color indices, (n, h, w) palette selects and
+    # (n, palettes, 4, 3) palettes: one fancy-indexing pass for every sprite.
+    mons = np.arange(len(pixels))[:, None, None]
+    return palettes[mons, selects, pixels]
+
+def sprite_images(tileset, count):
+    # (count, 32, 48) images from count consecutive 6x4 sprites.
+    return tileset.arrange_blocks(SPRITE_WIDTH, SPRITE_HEIGHT, 1).reshape(count, SPRITE_HEIGHT*8, SPRITE_WIDTH*8)
+
+def writeppm(path, rgb):
+    height, width = rgb.shape[:2]
+    with open(path, 'wb') as g:
+        g.write("P6\n{0} {1}\n255\n".format(width, height).encode("ascii") + rgb.tobytes())
     
 if len(sys.argv) != 2:
     sys.exit('usage: python3 pinballsprites.py rom.gbc')
-rom = open(sys.argv[1], 'rb')
+rom = RomImage(sys.argv[1])
 
 sprite_pointers = readfarpointers(0x12b50)
 palette_pointers = readfarpointers(0x12eda)
 palette_map_pointers = readfarpointers(0x12d15)
+count = len(sprite_pointers)
 
-pokesprites = []
-for pointer in sprite_pointers:
-    rom.seek(pointer)
-    pokesprites.append(readtiles(6*4))
-    print("read {}".format(hex(pointer)))
-    
-pokesilhouettes = []
-for pointer in sprite_pointers:
-    rom.seek(pointer+6*4*8*2)
-    pokesilhouettes.append(readtiles(6*4))
-    print("read silhouette {}".format(hex(pointer)))
-
-pokepalettes = []
-for pointer in palette_pointers:
-    rom.seek(pointer)
-    pokepalettes.append((readpalette(), readpalette()))
-    
-pokepalette_maps = []
-for pointer in palette_map_pointers:
-    rom.seek(pointer)
-    palmap = []
-    for i in range(6*4):
-        palmap.append(readbyte())
-    pokepalette_maps.append(palmap)
-    
-for sprite, palettes, palmap in zip(pokesprites, pokepalettes, pokepalette_maps):
-    for tile, pal in zip(sprite, palmap):
-        #print(pal, hex(len(sprite)), hex(len(palmap)), hex(6*4))
-        palette = palettes[pal-6]
-        for i, pixel in enumerate(tile):
-            tile[i] = palette[pixel]
-    
-silhouettepalette = ((31, 31, 31), (20, 20, 20), (8, 8, 8), (0, 0, 0))
-for sprite in pokesilhouettes:
-    for tile in sprite:
-        for i, pixel in enumerate(tile):
-            tile[i] = silhouettepalette[pixel]
-        
-#height = (math.ceil(len(tiles)/16))*8
-
-for i in range(len(pokesprites)):
-    sprite = pokesprites[i]
-    ppm = createppm(sprite)
-    g = open('s/{}.ppm'.format(i+1), 'wb')
-    g.write(ppm)
-    g.close()
-    
-    silhouette = pokesilhouettes[i]
-    ppm = createppm(pokesilhouettes[i])
-    g = open('s/silhouettes/{}.ppm'.format(i+1), 'wb')
-    g.write(ppm)
-    g.close()
+# Each sprite is followed by its silhouette; decode both in one go.
+graphics = tiles.decode(readblocks(sprite_pointers, 2*SPRITE_TILES*16), '2bpp')
+pixels = graphics.pixels.reshape(count, 2, SPRITE_TILES, 8, 8)
+sprites = sprite_images(tiles.TileSet(pixels[:, 0]), count)
+silhouettes = sprite_images(tiles.TileSet(pixels[:, 1]), count)
+
+# Two palettes per mon, and a map of which one (6 or 7) every tile uses.
+palettes = tiles.palettes(readblocks(palette_pointers, 2*4*2)).reshape(count, 2, 4, 3)
+palette_maps = np.frombuffer(readblocks(palette_map_pointers, SPRITE_TILES), dtype=np.uint8)
+selects = sprite_images(tiles.TileSet(np.repeat((palette_maps.astype(int) - 6) % 2, 64)), count)
+
+variants = {
+    's/{}.ppm': render(sprites, selects, palettes),
+    's/silhouettes/{}.ppm': render(silhouettes, np.zeros_like(selects), SILHOUETTE_PALETTE[None].repeat(count, 0)),
+}
+
+for i in range(count):
+    for path, images in variants.items():
+        writeppm(path.format(i+1), images[i])
     print ('Wrote {}'.format(i))
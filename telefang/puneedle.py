@@ -11,27 +11,18 @@ import struct
 import os
 import sys
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'tools'))
+from romimage import RomImage
+
 class InvalidGraphicsError(BaseException):
     pass
 
-def readint():
-    return struct.unpack("<I", rom.read(4))[0]
-
-def readshort():
-    return struct.unpack("<H", rom.read(2))[0]
-    
-def readbyte():
-    return struct.unpack("<B", rom.read(1))[0]
-    
-def abspointer(bank, offset):
-    return bank*0x4000+offset-0x4000
-
 def decompress(offset):
     rom.seek(offset)
     
-    magic = readshort()
+    magic = rom.readshort()
     if magic != 0x654c: raise InvalidGraphicsError("Wrong magic.")
-    total = readint()
+    total = rom.readint()
     if total > 0x10000: raise InvalidGraphicsError("Insane size: "+hex(total))
     print("total is", hex(total))
     data = bytearray()
@@ -39,7 +30,7 @@ def decompress(offset):
     try: 
         if total > 0:
             while len(data) < total: 
-                modes = readbyte()
+                modes = rom.readbyte()
                 #print(bin(modes))
                 for i in range(4):
                     mode = ((modes >> (i*2+1)) % 2 << 1) + ((modes >> i*2)%2)
@@ -47,14 +38,14 @@ def decompress(offset):
                     if first and mode in (0, 1): raise InvalidGraphicsError("Begins with mode "+str(mode))
                     first = False
                     if mode == 0:
-                        lz = readshort()
+                        lz = rom.readshort()
                         loc = (lz & 0b111111111111)+5 
                         num = (lz >> 12)+3
                         #print(bin(lz), hex(loc), hex(num))
                         for j in range(num):
                             data.append(data[len(data)-loc])
                     elif mode == 1:
-                        lz = readbyte()
+                        lz = rom.readbyte()
                         loc = (lz & 0b11)+1
                         num = (lz >> 2)+2
                         #print(bin(lz), hex(loc), hex(num))
@@ -62,10 +53,10 @@ def decompress(offset):
                             #print(j, data, len(data), len(data)-loc, len(data)-loc+j)
                             data.append(data[len(data)-loc])
                     elif mode == 2:
-                        data.append(readbyte())
+                        data.append(rom.readbyte())
                     elif mode == 3:
                         for i in range(mode):
-                            data.append(readbyte())
+                            data.append(rom.readbyte())
     except IndexError:# raise
         raise InvalidGraphicsError()
                 
@@ -84,31 +75,26 @@ if __name__ == '__main__':
     if not os.path.exists('g2'+os.sep):
         os.makedirs('g2')
     
-    rom = open(rom, 'rb')
+    rom = RomImage(rom)
     #rom.seek(0x134)
     #game = rom.read(8)
     
-    rom.seek(0x5036d6)
     i = 0
-    while True:
-        l = rom.tell()
+    # Let the mapping find the magic (0x654c, "Le") instead of reading every
+    # short in the ROM.
+    l = rom.find(b"Le", 0x5036d6)
+    while l >= 0:
+        print("Magic found at {}".format(hex(l+2)))
         try:
-            s = readshort()
-        except struct.error:
-            break
-        if s == 0x654c:
-            print("Magic found at {}".format(hex(rom.tell())))
-            try:
-                g = decompress(l)
-            except InvalidGraphicsError as ex:
-                print("Not OK:", str(ex))
-            else:
-                print("OK")
-                with open("g2/{:04}-{}.gba".format(i, hex(l)), 'bw') as f:
-                    f.write(g)
-                i += 1
-                
-        rom.seek(l+1)
+            g = decompress(l)
+        except (InvalidGraphicsError, struct.error) as ex:
+            print("Not OK:", str(ex))
+        else:
+            print("OK")
+            with open("g2/{:04}-{}.gba".format(i, hex(l)), 'bw') as f:
+                f.write(g)
+            i += 1
+        l = rom.find(b"Le", l+1)
 
     print ("Done..!", i)
     rom.close()
@@ -16,43 +16,33 @@ import struct
 import os
 import sys
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'tools'))
+from romimage import RomImage, absp
+
 class InvalidGraphicsError(BaseException):
     pass
 
-def readshort():
-    return struct.unpack("<H", rom.read(2))[0]
-
-def readbeshort():
-    return struct.unpack(">H", rom.read(2))[0]
-    
-def readbyte():
-    return struct.unpack("<B", rom.read(1))[0]
-    
-def abspointer(bank, offset):
-    return bank*0x4000+offset-0x4000
-
 def decompress(offset):
     rom.seek(offset)
     
     try:
-        compressed = readbyte()
+        compressed = rom.readbyte()
         data = bytearray() 
-        total = readshort()
+        total = rom.readshort()
         if total > 0:
             if compressed == 0x00:
                 for i in range(total):
-                    data.append(readbyte())
+                    data.append(rom.readbyte())
             else:
                 if compressed != 0x01:
                     raise InvalidGraphicsError(compressed)
                 while len(data) < total: 
-                    modes = readshort()
+                    modes = rom.readshort()
                     for mode in bin(modes)[2:].zfill(16)[::-1]:
                         if int(mode) == 1:
-                            e = rom.read(1)
-                            d = rom.read(1)
-                            loc = -(struct.unpack("<H", e+d)[0]  & 0x07ff) 
-                            num = ((struct.unpack("<B", d)[0] >> 3) & 0x1f) + 0x03 
+                            lz = rom.readshort()
+                            loc = -(lz & 0x07ff)
+                            num = ((lz >> 11) & 0x1f) + 0x03
                             loc += len(data)-1
                             for j in range(num):
                                 if loc < 0:
@@ -60,7 +50,7 @@ def decompress(offset):
                                 else:
                                     data.append(data[loc+j])
                         else:
-                            data.append(readbyte())
+                            data.append(rom.readbyte())
     except (InvalidGraphicsError, struct.error):
         return None, None
                 
@@ -84,19 +74,14 @@ if __name__ == '__main__':
     if not os.path.exists('g'+os.sep):
         os.makedirs('g')
     
-    rom = open(rom, 'rb')
+    rom = RomImage(rom)
     rom.seek(0x134)
     game = rom.read(8)
     if game == b'TELEFANG':
-        rom.seek(0x18000)
-        for i in range(0x80):
-            bank, target = struct.unpack("<BH", rom.read(3))
+        for i, (bank, target) in enumerate(rom.iter_unpack("<BHx", 0x18000, 0x80)):
             if target > 0x7fff and target < 0xa000:
                 graphics[i] = {'target':target, 'bank':bank}
-            rom.read(1)
-        rom.seek(0x1DE1)
-        for i in range(0x80):
-            pointer = struct.unpack("<H", rom.read(2))[0]
+        for i, (pointer,) in enumerate(rom.iter_unpack("<H", 0x1DE1, 0x80)):
             if i in graphics:
                 if pointer > 0x3fff and pointer < 0x8000:
                     graphics[i]['pointer'] = pointer
@@ -105,12 +90,12 @@ if __name__ == '__main__':
     elif game == b'MEDAROT ':
         rom.seek(0x10f0)
         for i in range(0x80):
-            p = readshort()
+            p = rom.readshort()
             rom.seek(p)
             g = {}
-            g['bank'] = readbyte()
-            g['pointer'] = readshort()
-            g['target'] = readshort()
+            g['bank'] = rom.readbyte()
+            g['pointer'] = rom.readshort()
+            g['target'] = rom.readshort()
             if g['target'] > 0x7fff and g['target'] < 0xa000 and g['pointer'] > 0x3fff and g['pointer'] < 0x8000:
                 graphics[i] = g
             rom.seek(0x10f0+i*0x2)
@@ -118,10 +103,10 @@ if __name__ == '__main__':
         rom.seek((0x3b*0x4000)+0x282b)
         for i in range(0xff):
             g = {}
-            g['bank'] = readbyte()
-            g['target'] = readshort()
+            g['bank'] = rom.readbyte()
+            g['target'] = rom.readshort()
             rom.seek(0x3a20+(i*0x2))
-            g['pointer'] = readshort()
+            g['pointer'] = rom.readshort()
             if g['target'] > 0x7fff and g['target'] < 0xa000 and g['pointer'] > 0x3fff and g['pointer'] < 0x8000:
                 graphics[i] = g
             rom.seek((0x3b*0x4000)+0x282b+(i*0x4)+4)
@@ -129,11 +114,11 @@ if __name__ == '__main__':
         rom.seek((0x39*0x4000)+0x306a)
         for i in range(0x1ff):
             g = {}
-            g['bank'] = readbyte()
-            g['target'] = readshort()
-            g['vrambank'] = readbyte()
+            g['bank'] = rom.readbyte()
+            g['target'] = rom.readshort()
+            g['vrambank'] = rom.readbyte()
             rom.seek(0x3995+(i*0x2))
-            g['pointer'] = readshort()
+            g['pointer'] = rom.readshort()
             if g['target'] > 0x7fff and g['target'] < 0xa000 and g['pointer'] > 0x3fff and g['pointer'] < 0x8000:
                 graphics[i] = g
             rom.seek((0x39*0x4000)+0x306a+(i*0x4)+4)
@@ -142,11 +127,11 @@ if __name__ == '__main__':
         rom.seek((0x7b*0x4000)+0x040a)
         for i in range(0xff):
             g = {}
-            g['bank'] = readbyte()
-            g['pointer'] = readbeshort()
-            readbyte()
-            readbyte()
-            readbyte()
+            g['bank'] = rom.readbyte()
+            g['pointer'] = rom.readbeshort()
+            rom.readbyte()
+            rom.readbyte()
+            rom.readbyte()
             g['target'] = 0
             graphics[i] = g
     elif game == b'CROC 2\0\0':
@@ -159,14 +144,14 @@ if __name__ == '__main__':
     if action == 'list':
         locs = {}
         for i, g in graphics.items():
-            addr = abspointer(g['bank'], g['pointer'])
+            addr = absp(g['bank'], g['pointer'])
             rom.seek(addr)
-            compressed = readbyte()
-            total = readshort()
+            compressed = rom.readbyte()
+            total = rom.readshort()
             decompress(addr)
-            locs[abspointer(g['bank'], g['pointer'])] = rom.tell() - addr
+            locs[absp(g['bank'], g['pointer'])] = rom.tell() - addr
             print ("{:>2x} - bank {:02x}:{:04x} (0x{:>06x}), 0x{:>3x} bytes {} read in {:04x}".format(
-            i, g['bank'], g['pointer'], abspointer(g['bank'], g['pointer']), total, "compressed" if compressed else "not compressed", g['target']))
+            i, g['bank'], g['pointer'], absp(g['bank'], g['pointer']), total, "compressed" if compressed else "not compressed", g['target']))
         lastbank = None
         lastend = None
         for loc in sorted(locs.keys()):
@@ -180,7 +165,7 @@ if __name__ == '__main__':
             
     elif action == 'extract':
         for gi, g in graphics.items():
-            l = abspointer(g['bank'], g['pointer'])
+            l = absp(g['bank'], g['pointer'])
 
             data, compressed = decompress(l)
 
@@ -0,0 +1,106 @@
+# batch runs a per-file converter (gb2pgm, gba2png) over a whole directory of
+# dumps on a process pool.  A file is skipped when its outputs from the last
+# run are newer than it, or when its content hash still matches the one
+# recorded in the directory's manifest (.<tool>.json), which covers dumps that
+# were re-extracted byte for byte.  Either way, only if it was converted with
+# the same options, which the tool passes as a string (see describe).
+#
+#   batch.convert_path(sys.argv[1], convert, '.pgm', 'gb2pgm')
+#   batch.convert_path(arg, functools.partial(convert, **options), '.png', 'png2gb',
+#                      options=batch.describe(options))
+#
+# convert(path) does the work for one file and returns the paths it wrote.
+
+import hashlib
+import json
+import multiprocessing
+import os
+
+def _fresh(path, outputs):
+    if not outputs:
+        return False
+    try:
+        mtime = os.path.getmtime(path)
+        return all(os.path.getmtime(output) >= mtime for output in outputs)
+    except OSError:
+        return False
+
+def describe(options):
+    # A converter's keyword options as short text that's the same from run
+    # to run; arrays (palettes) go in by digest.
+    parts = []
+    for name in sorted(options):
+        value = options[name]
+        if hasattr(value, 'tobytes'):
+            value = hashlib.sha1(value.tobytes()).hexdigest()[:12]
+        parts.append('{}={}'.format(name, value))
+    return ' '.join(parts)
+
+def _job(args):
+    convert, path, entry = args
+    with open(path, 'rb') as f:
+        digest = hashlib.sha1(f.read()).hexdigest()
+    if entry and entry['sha1'] == digest and all(os.path.exists(o) for o in entry['outputs']):
+        # Same bytes as last time; bump the outputs so the mtime check
+        # catches it next run.
+        for output in entry['outputs']:
+            os.utime(output, None)
+        return path, digest, entry['outputs'], False
+    return path, digest, convert(path), True
+
+def load_manifest(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (IOError, OSError, ValueError):
+        return {}
+
+def save_manifest(path, manifest):
+    with open(path + '.tmp', 'w') as f:
+        json.dump(manifest, f, indent=0, sort_keys=True)
+    os.replace(path + '.tmp', path)
+
+def convert_path(arg, convert, ignore, tool, accept='', options=''):
+    # Converts `arg`, a file or a directory; files ending in `ignore` (the
+    # tool's own output), files not ending in `accept`, and dotfiles are left
+    # out of directories.  Files last converted with other `options` are
+    # converted again.
+    if not os.path.isdir(arg):
+        convert(arg)
+        return
+    manifest_path = os.path.join(arg, '.{}.json'.format(tool))
+    manifest = load_manifest(manifest_path)
+    files = [os.path.join(arg, f) for f in sorted(os.listdir(arg))
+             if not f.endswith(ignore) and f.endswith(accept) and not f.startswith('.')]
+
+    # Drop files that have gone away; outputs are kept relative to the
+    # directory, so the manifest doesn't depend on where we're run from.
+    names = set(os.path.basename(path) for path in files)
+    manifest = dict((name, entry) for name, entry in manifest.items() if name in names)
+
+    jobs = []
+    for path in files:
+        entry = manifest.get(os.path.basename(path))
+        if entry and entry.get('options', '') != options:
+            # Converted some other way; nothing from last time applies.
+            entry = None
+        if entry:
+            entry = {'sha1': entry['sha1'], 'outputs': [os.path.join(arg, o) for o in entry['outputs']]}
+            if _fresh(path, entry['outputs']):
+                continue
+        jobs.append((convert, path, entry))
+
+    converted = 0
+    if jobs:
+        pool = multiprocessing.Pool()
+        try:
+            for path, digest, outputs, ran in pool.imap_unordered(_job, jobs):
+                outputs = [os.path.relpath(o, arg) for o in outputs]
+                manifest[os.path.basename(path)] = {'sha1': digest, 'options': options, 'outputs': outputs}
+                converted += ran
+        finally:
+            pool.close()
+            pool.join()
+            # Save what got done even if a file failed halfway through.
+            save_manifest(manifest_path, manifest)
+    print('{} of {} files converted, {} up to date'.format(converted, len(files), len(files) - converted))
@@ -1,84 +1,111 @@
-#!/usr/bin/python2
+#!/usr/bin/python3
 
-# gba2png converts 4bpp and 8bpp GBA graphics into PNGs.
+# gba2png converts 4bpp and 8bpp GBA graphics into PNGs.  It guesses which
+# of the two a file is, and how many tiles wide it's meant to be, from a
+# sample of its tiles; only when it can't tell does it write both readings.
+# -both always writes both.
 
-import struct
-import os
+import functools
 import sys
-import math
 
+import numpy as np
 import png
 
+import batch
+import tiles
+
 WIDTH=16
-bpp = 4
+WIDTHS = (1, 2, 3, 4, 5, 6, 8, 10, 12, 16, 20, 24, 30, 32)
+SAMPLE_TILES = 1024
+# Below this the 4bpp and 8bpp readings are too close to call.
+MIN_CONFIDENCE = 0.1
+
+def default_width(count):
+    if count == 16:
+        return 4
+    elif count == 64:
+        return 8
+    elif count == 100:
+        return 8
+    return WIDTH
+
+def smoothness(pixels):
+    # Fraction of neighbouring pixels inside a tile that are the same color;
+    # real graphics have flat areas and outlines, noise doesn't.
+    return ((pixels[:, 1:, :] == pixels[:, :-1, :]).mean() +
+            (pixels[:, :, 1:] == pixels[:, :, :-1]).mean()) / 2
 
-if len(sys.argv) != 2:
-    sys.exit('usage: python2 gba2png.py file/directory')
-arg = sys.argv[1]
-files = []
-if os.path.isdir(arg):
-    for f in sorted(os.listdir(arg)):
-        if f[-4:] != '.png':
-            files.append(os.path.join(arg, f))
-else:
-    files = [arg]
+def guess_width(pixels, count):
+    # The width that best continues each tile's bottom row into the top row
+    # of the tile under it.  Stays with the old default unless another width
+    # is clearly better.
+    default = default_width(count)
+    scores = {}
+    for width in WIDTHS:
+        if width < len(pixels):
+            scores[width] = (pixels[:-width, 7, :] == pixels[width:, 0, :]).mean()
+    if not scores:
+        return default
+    best = max(scores, key=scores.get)
+    if default in scores and scores[best] - scores[default] < 0.05:
+        return default
+    return best
 
-for f in files:
+def classify(data):
+    # [(bpp, width)] to write, best first, and how sure we are about the bpp.
+    sample = np.frombuffer(data, dtype=np.uint8)[:SAMPLE_TILES*64]
+    # Both nibbles of a 4bpp byte are pixels and use the same colors; the
+    # high nibble of an 8bpp palette index is far more predictable than the low.
+    low = np.bincount(sample & 0x0f, minlength=16) / max(1, len(sample))
+    high = np.bincount(sample >> 4, minlength=16) / max(1, len(sample))
+    nibbles = 1 - np.abs(low - high).sum() / 2
+
+    readings = {}
     for bpp in (4, 8):
-        gr = open(f, 'rb')
-        numbytes = len(gr.read())
-        gr.seek(0)
+        tileset = tiles.decode(sample, '{}bpp'.format(bpp))
+        if tileset:
+            count = len(data) // tiles.TILE_BYTES['{}bpp'.format(bpp)]
+            readings[bpp] = (smoothness(tileset.pixels), guess_width(tileset.pixels, count))
+    if len(readings) < 2:
+        return [(bpp, width) for bpp, (score, width) in readings.items()], 1.0
+
+    margin = readings[4][0] - readings[8][0] + nibbles - 0.5
+    order = (4, 8) if margin >= 0 else (8, 4)
+    # Noise isn't smooth either way round, and neither reading is worth more.
+    signal = max(readings[4][0], readings[8][0])
+    return [(bpp, readings[bpp][1]) for bpp in order], abs(margin) * signal
 
-        tiles = []
-        tile = []
+def convert(f, both=False):
+    # Reads the file once and writes its likely reading (or both, if unsure),
+    # a band of tiles at a time.
+    with open(f, 'rb') as gr:
+        data = memoryview(gr.read())
+    outputs = []
+    readings, confidence = classify(data)
+    if not readings:
+        print("{} doesn't constitute a single tile".format(f))
+    if not both and confidence >= MIN_CONFIDENCE:
+        readings = readings[:1]
+    for bpp, width in readings:
+        format = '{}bpp'.format(bpp)
+        count = len(data) // tiles.TILE_BYTES[format]
+        scale = 256 // (1<<bpp) # XXX other bpp
+        height = -(-count // width) * 8
+        rows = (row * scale for band in tiles.bands(data, format, width) for row in band)
+        fname = '{}-{}bpp.png'.format(f[:f.rfind('.')], bpp)
+        with open(fname, 'wb') as out:
+            png.Writer(width*8, height, greyscale=True, bitdepth=8).write(out, rows)
+        print ('Wrote '+fname)
+        outputs.append(fname)
+    return outputs
 
-        for tilerow in range(numbytes//bpp):
-            row = []
-            if bpp == 4:
-                for i in range(4):
-                    byte = ord(gr.read(1))
-                    row.append(byte & 0x0f)
-                    row.append(byte>>4)
-            else:
-                for i in range(8):
-                    byte = ord(gr.read(1))
-                    row.append(byte)
-            #for plane in range(bpp):
-            #    bp = ord(gr.read(1))
-            #    for b in range(8):
-            #        row[7-b] |= bool(bp & (1 << b)) << plane
-            #print row
-            tile += row
-            if len(tile) == 8*8:
-                tiles.append(tile)
-                tile = []
-        
-        if tiles:
-            if len(tiles) == 16:
-                width = 4
-            elif len(tiles) == 64:
-                width = 8
-            elif len(tiles) == 100:
-                width = 8
-            else:
-                width = WIDTH
-            
-            rows = []
-            height = int((math.ceil(float(len(tiles))/width)))*8
-            for rowi in range(height):
-                row = []
-                for coli in range(8*width):
-                    try:
-                        #print tiles[WIDTH*(rowi//8)+(coli//8)][8*(rowi%8)+(coli%8)] * (256 // (1<<bpp))
-                        row.append(tiles[width*(rowi//8)+(coli//8)][8*(rowi%8)+(coli%8)] * (256 // (1<<bpp))) # XXX other bpp
-                    except IndexError:
-                        row.append(0)
-                rows.append(row)
-            
-            #print rows
-            
-            fname = '{}-{}bpp.png'.format(f[:f.rfind('.')], bpp)
-            png.from_array(rows, 'L').save(fname)
-            print ('Wrote '+fname)
-        else:
-            print "{} doesn't constitute a single tile".format(f)
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    both = '-both' in args
+    if both:
+        args.remove('-both')
+    if len(args) != 1:
+        sys.exit('usage: python3 gba2png.py [-both] file/directory')
+    options = {'both': both}
+    batch.convert_path(args[0], functools.partial(convert, **options), '.png', 'gba2png',
+                       options=batch.describe(options))
@@ -0,0 +1,462 @@
+#!/usr/bin/python3
+
+# gbacomp handles the GBA BIOS compression formats (SWI 0x11-0x18) that most
+# GBA games keep their graphics and tilemaps in:
+#
+#   0x10  LZ77 (LZ77UnCompWram/Vram)
+#   0x24  Huffman, 4-bit units    0x28  Huffman, 8-bit units
+#   0x30  RLE
+#   0x81  8-bit diff filter       0x82  16-bit diff filter
+#
+# Every block starts with a 4-byte header: the type byte, then the
+# decompressed size as a 24-bit little-endian number.
+#
+#   out, end = gbacomp.decompress(rom.data, 0x3d4e88)
+#   data = gbacomp.compress(raw, 0x10)
+#
+# Run on its own, it scans a whole ROM for compressed blocks, checking every
+# plausible header by decompressing it, and optionally dumps what it finds:
+#
+#   $ python3 gbacomp.py telefang2.gba [outdir]
+#   3d4e88 10 2000 3d56c4
+
+import heapq
+import multiprocessing
+import os
+import struct
+import sys
+from itertools import accumulate
+
+import numpy as np
+
+from romimage import RomImage
+
+MIN_SIZE = 0x20
+MAX_SIZE = 0x40000
+CHUNK = 0x100000
+# Diff filters decode any bytes at all, so scanning for them only finds noise.
+SCAN_TYPES = (0x10, 0x24, 0x28, 0x30)
+
+class CompressionError(ValueError):
+    pass
+
+def header(data, offset):
+    if offset + 4 > len(data):
+        raise CompressionError("Header past the end of the data")
+    value, = struct.unpack_from("<I", data, offset)
+    return value & 0xff, value >> 8
+
+# LZ77
+
+def lz77_decompress(data, offset=0):
+    type_, size = header(data, offset)
+    if type_ != 0x10:
+        raise CompressionError("Not LZ77: {:#x}".format(type_))
+    out = bytearray()
+    pos = offset + 4
+    try:
+        while len(out) < size:
+            flags = data[pos]
+            pos += 1
+            for bit in range(8):
+                if len(out) >= size:
+                    break
+                if flags & (0x80 >> bit):
+                    b0, b1 = data[pos], data[pos+1]
+                    pos += 2
+                    n = (b0 >> 4) + 3
+                    disp = ((b0 & 0x0f) << 8 | b1) + 1
+                    if disp > len(out):
+                        raise CompressionError("Reference before the start at {:#x}".format(pos-2))
+                    start = len(out) - disp
+                    if disp >= n:
+                        out += out[start:start+n]
+                    else:
+                        # Overlapping copy: the last disp bytes, repeated.
+                        out += (out[start:] * (n // disp + 1))[:n]
+                else:
+                    out.append(data[pos])
+                    pos += 1
+    except IndexError:
+        raise CompressionError("Ran off the end of the data")
+    del out[size:]
+    return out, pos
+
+def lz77_compress(raw, vram=False):
+    # Greedy LZ77 with a hash chain over 3-byte prefixes.  vram avoids
+    # displacement 1, which the VRAM-safe BIOS call (16-bit writes) can't do.
+    raw = bytes(raw)
+    out = bytearray(struct.pack("<I", 0x10 | len(raw) << 8))
+    chains = {}
+    min_disp = 2 if vram else 1
+    pos = 0
+    while pos < len(raw):
+        flag_pos = len(out)
+        out.append(0)
+        for bit in range(8):
+            if pos >= len(raw):
+                break
+            best_len, best_disp = 0, 0
+            key = raw[pos:pos+3]
+            if len(key) == 3:
+                for candidate in reversed(chains.get(key, ())):
+                    disp = pos - candidate
+                    if disp > 0x1000:
+                        break
+                    if disp < min_disp:
+                        continue
+                    length = 3
+                    limit = min(18, len(raw) - pos)
+                    while length < limit and raw[candidate+length] == raw[pos+length]:
+                        length += 1
+                    if length > best_len:
+                        best_len, best_disp = length, disp
+                        if length == 18:
+                            break
+            if best_len >= 3:
+                out[flag_pos] |= 0x80 >> bit
+                out += bytes(((best_len - 3) << 4 | (best_disp - 1) >> 8, (best_disp - 1) & 0xff))
+                step = best_len
+            else:
+                out.append(raw[pos])
+                step = 1
+            for p in range(pos, pos + step):
+                chain = chains.setdefault(raw[p:p+3], [])
+                chain.append(p)
+                if len(chain) > 64:
+                    del chain[:32]
+            pos += step
+    return bytes(pad4(out))
+
+# Huffman
+
+def huffman_decompress(data, offset=0):
+    type_, size = header(data, offset)
+    if type_ not in (0x24, 0x28):
+        raise CompressionError("Not Huffman: {:#x}".format(type_))
+    bits = type_ & 0x0f
+    tree_size = (data[offset+4] + 1) * 2
+    root = 5
+    pos = offset + 4 + tree_size
+    out = bytearray()
+    node = root
+    half = None
+    try:
+        while len(out) < size:
+            word, = struct.unpack_from("<I", data, pos)
+            pos += 4
+            for i in range(31, -1, -1):
+                bit = word >> i & 1
+                value = data[offset + node]
+                child = (node & ~1) + (value & 0x3f) * 2 + 2 + bit
+                if child - 4 >= tree_size:
+                    raise CompressionError("Tree node out of range")
+                if value & (0x80 >> bit):
+                    unit = data[offset + child]
+                    if bits == 8:
+                        out.append(unit)
+                    elif half is None:
+                        half = unit & 0x0f
+                    else:
+                        out.append(half | (unit & 0x0f) << 4)
+                        half = None
+                    node = root
+                    if len(out) >= size:
+                        break
+                else:
+                    node = child
+    except (IndexError, struct.error):
+        raise CompressionError("Ran off the end of the data")
+    del out[size:]
+    return out, pos
+
+def huffman_compress(raw, bits=8):
+    raw = bytes(raw)
+    if bits == 8:
+        units = list(raw)
+    else:
+        units = [u for byte in raw for u in (byte & 0x0f, byte >> 4)]
+    if not units:
+        raise CompressionError("Nothing to compress")
+    counts = {}
+    for unit in units:
+        counts[unit] = counts.get(unit, 0) + 1
+    # Nodes are leaf values (ints) or [child0, child1] lists.
+    heap = [(count, i, unit) for i, (unit, count) in enumerate(sorted(counts.items()))]
+    if len(heap) == 1:
+        heap.append((0, len(heap), (heap[0][2] + 1) % (1 << bits)))
+    heapq.heapify(heap)
+    serial = len(heap)
+    while len(heap) > 1:
+        a = heapq.heappop(heap)
+        b = heapq.heappop(heap)
+        heapq.heappush(heap, (a[0] + b[0], serial, [a[2], b[2]]))
+        serial += 1
+    root = heap[0][2]
+
+    # Lay the tree out in pairs: pair j is table[2+2j:4+2j] and holds some
+    # node's two children; the root sits alone at table[1] and counts as
+    # pair -1.  A node's children have to come 1 to 64 pairs after the pair
+    # the node sits in, which breadth first overruns on wide trees (random
+    # bytes, say).  So nodes are laid out depth first, except that when a
+    # waiting node would otherwise run out of reach, the one due soonest
+    # goes next.
+    waiting = [(-1, 1, root)]   # (pair it sits in, its table slot, node)
+    placed = []
+    while waiting:
+        j = len(placed)
+        due = sorted(p + 64 for p, slot, node in waiting)
+        if any(deadline <= j + i for i, deadline in enumerate(due)):
+            pick = min(range(len(waiting)), key=lambda k: waiting[k][0])
+        else:
+            pick = len(waiting) - 1
+        p, slot, node = waiting.pop(pick)
+        if j - p - 1 > 0x3f:
+            raise CompressionError("Huffman tree too wide for the node format")
+        placed.append((p, slot, node))
+        for bit, child in enumerate(node):
+            if isinstance(child, list):
+                waiting.append((j, 2 + 2 * j + bit, child))
+    # Padded so the bitstream after it stays word aligned.
+    table = bytearray(2 + 2 * len(placed) + 2 * (len(placed) % 2 == 0))
+    table[0] = len(table) // 2 - 1
+    for j, (p, slot, node) in enumerate(placed):
+        value = j - p - 1
+        for bit, child in enumerate(node):
+            if not isinstance(child, list):
+                value |= 0x80 >> bit
+                table[2 + 2 * j + bit] = child
+        table[slot] = value
+
+    codes = {}
+    def walk(node, code, length):
+        if not isinstance(node, list):
+            codes[node] = (code, length)
+            return
+        walk(node[0], code << 1, length + 1)
+        walk(node[1], code << 1 | 1, length + 1)
+    walk(root, 0, 0)
+
+    out = bytearray(struct.pack("<I", (0x20 | bits) | len(raw) << 8)) + table
+    word, used = 0, 0
+    for unit in units:
+        code, length = codes[unit]
+        for i in range(length - 1, -1, -1):
+            word = word << 1 | (code >> i & 1)
+            used += 1
+            if used == 32:
+                out += struct.pack("<I", word)
+                word, used = 0, 0
+    if used:
+        out += struct.pack("<I", word << (32 - used))
+    return bytes(out)
+
+# RLE
+
+def rle_decompress(data, offset=0):
+    type_, size = header(data, offset)
+    if type_ != 0x30:
+        raise CompressionError("Not RLE: {:#x}".format(type_))
+    out = bytearray()
+    pos = offset + 4
+    try:
+        while len(out) < size:
+            flag = data[pos]
+            if flag & 0x80:
+                out += bytes((data[pos+1],)) * ((flag & 0x7f) + 3)
+                pos += 2
+            else:
+                n = (flag & 0x7f) + 1
+                if pos + 1 + n > len(data):
+                    raise IndexError
+                out += data[pos+1:pos+1+n]
+                pos += 1 + n
+    except IndexError:
+        raise CompressionError("Ran off the end of the data")
+    del out[size:]
+    return out, pos
+
+def rle_compress(raw):
+    raw = bytes(raw)
+    out = bytearray(struct.pack("<I", 0x30 | len(raw) << 8))
+    literal = bytearray()
+    pos = 0
+    while pos < len(raw):
+        run = 1
+        while pos + run < len(raw) and run < 130 and raw[pos+run] == raw[pos]:
+            run += 1
+        if run >= 3:
+            if literal:
+                out += bytes((len(literal) - 1,)) + literal
+                literal = bytearray()
+            out += bytes((0x80 | (run - 3), raw[pos]))
+            pos += run
+        else:
+            literal.append(raw[pos])
+            pos += 1
+            if len(literal) == 128:
+                out += bytes((127,)) + literal
+                literal = bytearray()
+    if literal:
+        out += bytes((len(literal) - 1,)) + literal
+    return bytes(pad4(out))
+
+# Diff filters
+
+def diff_decompress(data, offset=0):
+    type_, size = header(data, offset)
+    if type_ not in (0x81, 0x82):
+        raise CompressionError("Not a diff filter: {:#x}".format(type_))
+    end = offset + 4 + size
+    if end > len(data):
+        raise CompressionError("Ran off the end of the data")
+    if type_ == 0x81:
+        out = bytearray(accumulate(data[offset+4:end], lambda a, b: (a + b) & 0xff))
+    else:
+        words = struct.unpack_from("<{}H".format(size // 2), data, offset + 4)
+        out = bytearray(struct.pack("<{}H".format(size // 2), *accumulate(words, lambda a, b: (a + b) & 0xffff)))
+    return out, end
+
+def diff_compress(raw, bits=8):
+    raw = bytes(raw)
+    if bits == 8:
+        body = bytes((b - a) & 0xff for a, b in zip(b"\0" + raw, raw))
+    else:
+        words = struct.unpack("<{}H".format(len(raw) // 2), raw[:len(raw) // 2 * 2])
+        body = struct.pack("<{}H".format(len(words)), *((b - a) & 0xffff for a, b in zip((0,) + words, words)))
+    return struct.pack("<I", (0x80 | bits // 8) | len(body) << 8) + body
+
+def pad4(out):
+    while len(out) % 4:
+        out.append(0)
+    return out
+
+DECOMPRESSORS = {0x10: lz77_decompress, 0x24: huffman_decompress, 0x28: huffman_decompress,
+                 0x30: rle_decompress, 0x81: diff_decompress, 0x82: diff_decompress}
+
+def decompress(data, offset=0):
+    # (decompressed bytearray, offset right after the compressed block).
+    type_, size = header(data, offset)
+    if type_ not in DECOMPRESSORS:
+        raise CompressionError("Unknown compression type {:#x}".format(type_))
+    return DECOMPRESSORS[type_](data, offset)
+
+def compress(raw, type_=0x10):
+    if type_ == 0x10:
+        return lz77_compress(raw)
+    elif type_ in (0x24, 0x28):
+        return huffman_compress(raw, type_ & 0x0f)
+    elif type_ == 0x30:
+        return rle_compress(raw)
+    elif type_ in (0x81, 0x82):
+        return diff_compress(raw, (type_ & 0x0f) * 8)
+    raise CompressionError("Unknown compression type {:#x}".format(type_))
+
+# ROM scanner
+
+def candidates(data, start, end):
+    # Word-aligned offsets in [start, end) with a plausible header.
+    start -= start % 4
+    words = np.frombuffer(data, dtype="<u4", count=(min(end, len(data) - 4) - start) // 4, offset=start)
+    types = words & 0xff
+    sizes = words >> 8
+    ok = np.isin(types, SCAN_TYPES) & (sizes >= MIN_SIZE) & (sizes <= MAX_SIZE)
+    offsets = start + 4 * np.flatnonzero(ok)
+    # LZ77 has to start with a literal, since there's nothing to copy yet.
+    lz = data[offsets[types[ok] == 0x10] + 4] if len(offsets) else np.array([], dtype=np.uint8)
+    keep = np.ones(len(offsets), dtype=bool)
+    keep[np.flatnonzero(types[ok] == 0x10)[lz & 0x80 != 0]] = False
+    return [int(o) for o in offsets[keep]]
+
+def plausible_tree(data, offset):
+    # An encoder fills its Huffman tree table: every node is reachable from
+    # the root exactly once.  Random bytes rarely manage that.
+    tree_size = (data[offset+4] + 1) * 2
+    if offset + 4 + tree_size > len(data):
+        return False
+    seen = set()
+    stack = [5]
+    while stack:
+        node = stack.pop()
+        value = data[offset + node]
+        first = (node & ~1) + (value & 0x3f) * 2 + 2
+        for bit in (0, 1):
+            child = first + bit
+            if child - 4 >= tree_size or child in seen:
+                return False
+            seen.add(child)
+            if not value & (0x80 >> bit):
+                stack.append(child)
+    # Allow for the padding that keeps the bitstream aligned.
+    return len(seen) >= tree_size - 4
+
+def canonical_rle(data, offset, end):
+    # An encoder doesn't split a literal block short of 128 bytes, or a run
+    # short of 130, in two; random bytes do it all the time.
+    pos = offset + 4
+    last = None
+    while pos < end:
+        flag = data[pos]
+        if flag & 0x80:
+            block = ('run', data[pos+1])
+            if last == block:
+                return False
+            pos += 2
+        else:
+            block = ('literal', flag)
+            if last is not None and last[0] == 'literal' and last[1] != 127:
+                return False
+            pos += (flag & 0x7f) + 2
+        last = block if block[0] == 'literal' or flag & 0x7f != 0x7f else None
+    return True
+
+def scan_chunk(args):
+    path, start, end = args
+    rom = RomImage(path)
+    data = np.frombuffer(rom.data, dtype=np.uint8)
+    view = memoryview(rom.data)
+    found = []
+    for offset in candidates(data, start, end):
+        type_, size = header(view, offset)
+        if type_ in (0x24, 0x28) and not plausible_tree(view, offset):
+            continue
+        # Compressed data shouldn't be much bigger than what it decompresses
+        # to (a 4-bit Huffman tree and bitstream can be a little over); cutting
+        # the view off there makes bad candidates fail early.
+        try:
+            out, stop = decompress(view[:offset + 4 + size + size // 8 + 0x200], offset)
+        except CompressionError:
+            continue
+        if type_ == 0x30 and not canonical_rle(view, offset, stop):
+            continue
+        found.append((offset, type_, len(out), stop))
+    del data, view
+    rom.close()
+    return found
+
+def scan(path, chunk=CHUNK):
+    size = os.path.getsize(path)
+    jobs = [(path, start, min(start + chunk, size)) for start in range(0, size, chunk)]
+    pool = multiprocessing.Pool()
+    try:
+        found = []
+        for result in pool.imap(scan_chunk, jobs):
+            found.extend(result)
+    finally:
+        pool.close()
+        pool.join()
+    return found
+
+if __name__ == '__main__':
+    if len(sys.argv) not in (2, 3):
+        sys.exit('usage: python3 gbacomp.py rom.gba [outdir]')
+    outdir = sys.argv[2] if len(sys.argv) > 2 else None
+    if outdir:
+        os.makedirs(outdir, exist_ok=True)
+        rom = RomImage(sys.argv[1])
+    for offset, type_, size, end in scan(sys.argv[1]):
+        print('{:x} {:02x} {:x} {:x}'.format(offset, type_, size, end))
+        if outdir:
+            out, _ = decompress(rom.data, offset)
+            with open(os.path.join(outdir, '{:x}.bin'.format(offset)), 'wb') as f:
+                f.write(out)
@@ -1,6 +1,19 @@
 #!/bin/python3
+import sys
+
+if __name__=="__main__" and not {"-f", "-b"} & set(sys.argv[1:3]):
+    # A running gbdserver answers without this process importing anything.
+    import gbdclient
+    if gbdclient.forward(["gbaddr"] + sys.argv[1:]):
+        sys.exit()
+
+import re
+from array import array
 from sys import argv
 
+GBA_ROM = 0x08000000
+GBA_ROM_MASK = 0x01ffffff
+
 def gbaddr(arg):
     if isinstance(arg, int):
         return arg
@@ -37,9 +50,133 @@ def gbswitch(arg):
         
         return f"{bank:02x}:{pointer:04x}"
 
-if __name__=="__main__":
-    for arg in argv[1:]:
-        string = gbswitch(arg)
-        print(f"{string}", end=" ")
+def gbaswitch(arg):
+    # 08xxxxxx bus pointers and linear ROM offsets, in either direction.
+    address = int(arg, 16) if isinstance(arg, str) else arg
+    if address >= GBA_ROM:
+        return f"{address & GBA_ROM_MASK:x}"
+    else:
+        return f"{GBA_ROM | address:08x}"
+
+# Array versions of the above, for converting whole tables at once.  They take
+# NumPy arrays, array.array or plain sequences; results are NumPy arrays when
+# NumPy is around and array.array('l') otherwise.  Addresses that don't map
+# (a pointer outside 4000-7FFF in a switchable bank) come out as -1.  NumPy is
+# only imported once one of them is called, so plain conversions (and gbd)
+# don't pay for it.
+
+def _numpy():
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+def _values(seq, np):
+    if np is not None:
+        return np.asarray(seq, dtype=np.int64)
+    return array('l', seq)
+
+def gbaddr_array(banks, pointers):
+    np = _numpy()
+    banks, pointers = _values(banks, np), _values(pointers, np)
+    if np is not None:
+        home = (banks == 0) & (pointers < 0x4000)
+        switched = (pointers >= 0x4000) & (pointers < 0x8000)
+        linear = banks * 0x4000 + pointers - 0x4000
+        return np.where(home, pointers, np.where(switched, linear, -1))
+    out = array('l')
+    for bank, pointer in zip(banks, pointers):
+        if bank == 0 and pointer < 0x4000:
+            out.append(pointer)
+        elif 0x4000 <= pointer < 0x8000:
+            out.append(bank * 0x4000 + pointer - 0x4000)
+        else:
+            out.append(-1)
+    return out
+
+def gbswitch_array(addresses):
+    np = _numpy()
+    addresses = _values(addresses, np)
+    if np is not None:
+        banks = addresses // 0x4000
+        pointers = np.where(banks > 0, addresses % 0x4000 + 0x4000, addresses)
+        return banks, pointers
+    banks = array('l', (address // 0x4000 for address in addresses))
+    pointers = array('l', (address % 0x4000 + 0x4000 if address >= 0x4000 else address
+                           for address in addresses))
+    return banks, pointers
+
+def gba_pointer_array(offsets):
+    np = _numpy()
+    offsets = _values(offsets, np)
+    if np is not None:
+        return offsets | GBA_ROM
+    return array('l', (offset | GBA_ROM for offset in offsets))
 
-print()
+def gba_offset_array(pointers):
+    np = _numpy()
+    pointers = _values(pointers, np)
+    if np is not None:
+        valid = (pointers >= GBA_ROM) & (pointers < 0x0e000000)
+        return np.where(valid, pointers & GBA_ROM_MASK, -1)
+    return array('l', (pointer & GBA_ROM_MASK if GBA_ROM <= pointer < 0x0e000000 else -1
+                       for pointer in pointers))
+
+# Text filter: rewrite every address in a stream, e.g. a whole .sym file or an
+# emulator log.  GB bank:pointer pairs become linear offsets and vice versa
+# (linear offsets are only recognized with a 0x prefix, so plain numbers in the
+# text are left alone; offsets are written with it too, so the output can
+# be fed back in).  With gba, 08xxxxxx pointers and 0x offsets are swapped.
+
+GB_BANKED = re.compile(rb"\b([0-9a-fA-F]{2}):([0-9a-fA-F]{4})\b")
+GBA_POINTER = re.compile(rb"\b(?:0x)?(0[89a-dA-D][0-9a-fA-F]{6})\b")
+LINEAR = re.compile(rb"\b0x([0-9a-fA-F]+)\b")
+
+def _gb_linear(match):
+    address = gbaddr(match.group(0).decode())
+    if not isinstance(address, int):
+        return match.group(0)
+    return f"0x{address:x}".encode()
+
+def _gb_banked(match):
+    return gbswitch(int(match.group(1), 16)).encode()
+
+def _gba_linear(match):
+    return f"0x{int(match.group(1), 16) & GBA_ROM_MASK:x}".encode()
+
+def _gba_banked(match):
+    return f"{GBA_ROM | int(match.group(1), 16):08x}".encode()
+
+FILTERS = {
+    (False, False): (GB_BANKED, _gb_linear),
+    (False, True): (LINEAR, _gb_banked),
+    (True, False): (GBA_POINTER, _gba_linear),
+    (True, True): (LINEAR, _gba_banked),
+}
+
+def filter_stream(infile, outfile, gba=False, to_banked=False):
+    pattern, replace = FILTERS[gba, to_banked]
+    # Whole chunks of lines at a time; a line never straddles two chunks.
+    while True:
+        lines = infile.readlines(1 << 20)
+        if not lines:
+            break
+        outfile.write(pattern.sub(replace, b"".join(lines)))
+
+def main(args, out=sys.stdout):
+    gba = "--gba" in args
+    if gba:
+        args = [arg for arg in args if arg != "--gba"]
+    for arg in args:
+        string = gbaswitch(arg) if gba else gbswitch(arg)
+        print(f"{string}", end=" ", file=out)
+
+    print(file=out)
+
+if __name__=="__main__":
+    args = argv[1:]
+    if {"-f", "-b"} & set(args[:2]):
+        filter_stream(sys.stdin.buffer, sys.stdout.buffer, gba="--gba" in args, to_banked="-b" in args[:2])
+    else:
+        main(args)
@@ -1,74 +1,188 @@
 #!/usr/bin/python3
+import sys
+
+if __name__ == "__main__":
+    # Hand the command to a running gbdserver if there is one, before paying
+    # for the imports below; the server has them loaded already.
+    import gbdclient
+    if gbdclient.forward(["gbd"] + sys.argv[1:]):
+        sys.exit()
+
+import os
 import struct
-from sys import argv, stderr
+from functools import lru_cache
+from itertools import groupby
+from sys import argv
 from gbaddr import gbaddr, gbswitch
+from romimage import RomImage, relp
+from sm83 import Disassembler
+import symfile
 
-def readbyte():  return struct.unpack("B",  rom.read(1))[0]
-def readshort(): return struct.unpack("<H", rom.read(2))[0]
+RECORDS = {"w": "<H", "wb": "<HB", "bw": "<BH", "b": "<B"}
 
-rom = open(argv[1], "rb")
-# TODO load symfile
+# Record specs: field types separated by commas or spaces, each optionally
+# named, with an optional leading d (data, the default) or s (sym entries).
+#   "b w w w w"  or  "s,bank:b,Enter:w,Init:w,:w,Leave:w"
+# A field named bank gives the bank for the record's words; x skips a byte.
+FIELDS = {"b": "B", "w": "H", "x": "x"}
+
+def is_record_spec(format):
+    # A single named field ("Enter:w") is a spec too; a single bare type is
+    # one of the RECORDS formats.
+    return "," in format or " " in format.strip() or ":" in format
+
+@lru_cache(maxsize=None)
+def compile_record(spec):
+    tokens = spec.replace(",", " ").split()
+    mode = "d"
+    if tokens and tokens[0] in ("d", "s"):
+        mode = tokens.pop(0)
+    fields = []
+    for token in tokens:
+        name, colon, type_ = token.rpartition(":")
+        if type_ not in FIELDS:
+            raise ValueError(f"Unknown field type {type_} in {spec}")
+        fields.append((name if colon else None, type_))
+    record = struct.Struct("<" + "".join(FIELDS[type_] for name, type_ in fields))
+    return mode, [field for field in fields if field[1] != "x"], record
+
+def dump_records(rom, address, spec, count, label=None, symbols=None, out=sys.stdout):
+    mode, fields, record = compile_record(spec)
+    names = [name for name, type_ in fields]
+    bank_field = names.index("bank") if "bank" in names else None
+    words, suffixes = word_suffixes(fields)
+    table_bank = address // 0x4000
+    if not isinstance(label, str):
+        # A number is db's bytes per line, which records have no use for.
+        label = None
 
-address = gbaddr(argv[2])
-if not isinstance(address, int):
-    exit("Failed to convert address.  Please check your ranges.")
-address_bank = address // 0x4000
-format = argv[3]
-count = eval(argv[4])
-label = None
-if len(argv) > 5:
-    try:
-        label = int(argv[5])
-    except ValueError:
-        label = argv[5]
-
-rom.seek(address)
-values = []
-
-data_format = format.lstrip("ds")
-if data_format == "w":
-    for i in range(count):
-        values.append(readshort())
-elif data_format == "wb":
-    for i in range(count):
-        values.append((readshort(), readbyte()))
-elif data_format == "bw":
-    for i in range(count):
-        values.append((readbyte(), readshort()))
-elif data_format == "b":
-    for i in range(count):
-        values.append(readbyte())
-else:
-    stderr.write(f"Unknown format {format}\n")
-
-if type(label) == int and data_format == "b":
-    comma = ", "
-    if label > 8:
-        comma = ","
     lines = []
-    line = []
-    for i, value in enumerate(values):
-        line.append(value)
-        if len(line) >= label:
+    for n, values in enumerate(rom.iter_unpack(record, address, count)):
+        bank = values[bank_field] if bank_field is not None else table_bank
+        if mode == "s":
+            for i in words:
+                lines.append(f"{bank:02x}:{values[i]:04x} {label or ''}{n:x}{suffixes[i]}")
+            continue
+        if label:
+            lines.append(f"{label}{n:x}:")
+        for type_, group in groupby(zip(fields, values), key=lambda fv: fv[0][1]):
+            group = [value for field, value in group]
+            if type_ == "b":
+                lines.append("    db " + ", ".join(f"${value:02x}" for value in group))
+            else:
+                lines.append("    dw " + ", ".join(word_string(symbols, bank, value) for value in group))
+    if lines:
+        print("\n".join(lines), file=out)
+    return address + record.size*count
+
+def word_suffixes(fields):
+    # Indices of the word fields, and the label suffix each one gets.
+    words = [i for i, (name, type_) in enumerate(fields) if type_ == "w"]
+    suffixes = {}
+    for j, i in enumerate(words):
+        name = fields[i][0]
+        if name is None:
+            name = f"_{j}" if len(words) > 1 else ""
+        suffixes[i] = name
+    return words, suffixes
+
+def dump_code(rom, address, spec, count, label=None, symbols=None, out=sys.stdout):
+    # code disassembles from address; code:<record spec> disassembles from
+    # every word in a table of `count` records, sharing one trace, e.g.
+    #   gbd hm3.gbc 04:58b9 code:bank:b,Enter:w,Init:w,:w,Leave:w 0x50 State
+    dis = Disassembler(rom, symbols)
+    if not spec:
+        bank, pointer = relp(address)
+        dis.add_entry(bank, pointer, label if isinstance(label, str) else None)
+        dis.trace()
+        print("\n".join(dis.listing()), file=out)
+        return dis.block_end(address)
+
+    mode, fields, record = compile_record(spec)
+    names = [name for name, type_ in fields]
+    bank_field = names.index("bank") if "bank" in names else None
+    words, suffixes = word_suffixes(fields)
+    table_bank = address // 0x4000
+    for n, values in enumerate(rom.iter_unpack(record, address, count)):
+        bank = values[bank_field] if bank_field is not None else table_bank
+        for i in words:
+            pointer = values[i]
+            # Null entries, RAM, and banked pointers with no bank to go on.
+            if pointer >= 0x8000 or (bank == 0 and pointer >= 0x4000):
+                continue
+            dis.add_entry(bank, pointer, f"{label}{n:x}{suffixes[i]}" if isinstance(label, str) else None)
+    dis.trace()
+    print("\n".join(dis.listing()), file=out)
+    return address + record.size*count
+
+def word_string(symbols, bank, value):
+    name = symbols.label(bank, value) if symbols else None
+    return name or f"${value:04x}"
+
+def read_values(rom, address, data_format, count):
+    values = list(rom.iter_unpack(RECORDS[data_format], address, count))
+    if len(data_format) == 1:
+        values = [value for value, in values]
+    return values
+
+def dump(rom, address, format, count, label=None, symbols=None, out=sys.stdout):
+    # Prints `count` entries of `format` at `address` and returns the address
+    # right after the table.
+    if format == "code" or format.startswith("code:"):
+        try:
+            return dump_code(rom, address, format[5:], count, label, symbols, out)
+        except ValueError as ex:
+            print(ex, file=sys.stderr)
+            return address
+    if is_record_spec(format):
+        try:
+            compile_record(format)
+        except ValueError as ex:
+            print(ex, file=sys.stderr)
+            return address
+        return dump_records(rom, address, format, count, label, symbols, out)
+    address_bank = address // 0x4000
+    data_format = format.lstrip("ds")
+    if data_format not in RECORDS:
+        print(f"Unknown format {format}", file=sys.stderr)
+        return address
+    values = read_values(rom, address, data_format, count)
+    end = address + count*struct.calcsize(RECORDS[data_format])
+
+    if type(label) == int and data_format == "b":
+        comma = ", "
+        if label > 8:
+            comma = ","
+        lines = []
+        line = []
+        for i, value in enumerate(values):
+            line.append(value)
+            if len(line) >= label:
+                lines.append(line)
+                line = []
+        if line:
             lines.append(line)
-            line = []
-    if line:
-        lines.append(line)
-    for line in lines:
-        print(f"    db " + comma.join(f"${x:02x}" for x in line))
-else:
+        for line in lines:
+            print(f"    db " + comma.join(f"${x:02x}" for x in line), file=out)
+        return end
+
     for i, value in enumerate(values):
         if format == "dw":
             value_string = f"${value:04x}"
             if label:
                 value_string = f"{label}{i:X} ; {value_string}"
+            elif symbols:
+                value_string = annotate(symbols, address_bank, value, value_string)
             line = f"    dw {value_string}"
         elif format == "dwb":
             a, b = value
             value_string = f"${a:04x}, ${b:02x}"
+            name = symbols.label(b, a) if symbols and not label else None
             if label:
                 #value_string = f"{label}{i:X}, BANK({label}{i:X}) ; {value_string}"
                 line = f"    pwb {label}{i:x} ; {b:02x}:{a:04x}"
+            elif name:
+                line = f"    pwb {name} ; {b:02x}:{a:04x}"
             else:
                 line = f"    dwb {value_string}"
         elif format == "swb":
@@ -82,7 +196,143 @@ else:
             line = f"{address_bank:02x}:{a:04x} {label}{i:x}"
         else:
             line = hex(value)
-        
-        print(line)
 
-print(f"; {gbswitch(rom.tell())}")
+        print(line, file=out)
+    return end
+
+# How far past a label a pointer can be and still be named after it; past
+# that, a word is as likely to be data that happens to be near a label.
+MAX_LABEL_OFFSET = 0x40
+
+def annotate(symbols, bank, pointer, value_string):
+    # "State0 ; $2707" for labelled pointers, "$270a ; State0+3" for pointers
+    # a little way into something.  RAM pointers are looked up in bank 0,
+    # where the .sym file puts WRAM and HRAM.  A table in bank 0 can't tell
+    # us which bank its 4000-7FFF pointers are for, so those are left alone.
+    if bank == 0 and 0x4000 <= pointer < 0x8000:
+        return value_string
+    if pointer >= 0x8000:
+        bank = 0
+    found = symbols.lookup(bank, pointer)
+    if not found:
+        return value_string
+    name, offset = found
+    if offset == 0:
+        return f"{name} ; {value_string}"
+    if offset > MAX_LABEL_OFFSET:
+        return value_string
+    return f"{value_string} ; {name}+{offset:x}"
+
+def parse_address(arg, symbols):
+    if symbols and arg in symbols:
+        bank, pointer = symbols.address(arg)
+        return gbaddr(f"{bank:02x}:{pointer:04x}")
+    try:
+        return gbaddr(arg)
+    except ValueError:
+        return None
+
+def parse_label(arg):
+    try:
+        return int(arg)
+    except ValueError:
+        return arg
+
+def read_manifest(lines, symbols=None):
+    # One table per line, same as the command line minus the ROM:
+    #   7b:4427 dwb 0x14 Tilemap
+    #   7A:745C db  20*13 20
+    # ; and # start comments, on a line of their own or after a table (as in
+    # ptrscan's output); blank lines are skipped.
+    entries = []
+    for lineno, line in enumerate(lines, 1):
+        fields = line.split(";")[0].split("#")[0].split()
+        if not fields:
+            continue
+        if len(fields) < 3:
+            raise ValueError(f"line {lineno}: expected address, format and count")
+        address = parse_address(fields[0], symbols)
+        if not isinstance(address, int):
+            raise ValueError(f"line {lineno}: failed to convert address {fields[0]}")
+        count = eval(fields[2], {"__builtins__": {}})
+        label = parse_label(fields[3]) if len(fields) > 3 else None
+        entries.append((address, fields[1], count, label))
+    # Walk the ROM front to back, so neighbouring tables come out together.
+    entries.sort(key=lambda entry: entry[0])
+    return entries
+
+def dump_manifest(rom, entries, symbols=None, out=None, outdir=None):
+    last_end = None
+    for address, format, count, label in entries:
+        if outdir:
+            name = label if isinstance(label, str) else gbswitch(address).replace(":", "_")
+            f = open(os.path.join(outdir, f"{name}.asm"), "w")
+        else:
+            f = out
+            if last_end is not None and address != last_end:
+                print(file=f)
+        end = dump(rom, address, format, count, label, symbols, out=f)
+        print(f"; {gbswitch(end)}", file=f)
+        if outdir:
+            f.close()
+        last_end = end
+
+_roms = {}
+
+def load_rom(path):
+    # One mapping per ROM for as long as the file stays the same, so a
+    # long-lived caller (gbdserver) doesn't remap it on every command.
+    stat = os.stat(path)
+    path = os.path.abspath(path)
+    stamp = (stat.st_mtime_ns, stat.st_size)
+    if path in _roms and _roms[path][0] != stamp:
+        # The file changed; let go of the old mapping.
+        try:
+            _roms.pop(path)[1].close()
+        except BufferError:
+            pass
+    if path not in _roms:
+        _roms[path] = (stamp, RomImage(path))
+    return _roms[path][1]
+
+def main(argv, out=sys.stdout):
+    if len(argv) < 4:
+        sys.exit("usage: gbd rom.gbc address format count [label]\n"
+                 "       gbd rom.gbc -m manifest [-o combined.asm | -d outdir]")
+    rom = load_rom(argv[1])
+    symbols = symfile.load(symfile.symfile_for(argv[1]))
+
+    if argv[2] == "-m":
+        with open(argv[3]) as f:
+            try:
+                entries = read_manifest(f, symbols)
+            except ValueError as ex:
+                sys.exit(f"{argv[3]}: {ex}")
+        outdir = None
+        if len(argv) > 5 and argv[4] == "-o":
+            with open(argv[5], "w") as f:
+                dump_manifest(rom, entries, symbols, out=f)
+            return
+        elif len(argv) > 5 and argv[4] == "-d":
+            outdir = argv[5]
+            os.makedirs(outdir, exist_ok=True)
+        dump_manifest(rom, entries, symbols, out=out, outdir=outdir)
+        return
+
+    if len(argv) < 5:
+        sys.exit("usage: gbd rom.gbc address format count [label]")
+    address = parse_address(argv[2], symbols)
+    if not isinstance(address, int):
+        sys.exit("Failed to convert address.  Please check your ranges.")
+    format = argv[3]
+    count = eval(argv[4])
+    label = None
+    if len(argv) > 5:
+        label = parse_label(argv[5])
+
+    end = dump(rom, address, format, count, label, symbols, out=out)
+
+    print(f"; {gbswitch(end)}", file=out)
+
+if __name__ == "__main__":
+    main(argv)
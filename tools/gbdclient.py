@@ -0,0 +1,56 @@
+#!/usr/bin/python3
+
+# gbdclient hands a gbd/gbaddr command line to a running gbdserver.  gbd.py
+# and gbaddr.py call it before importing anything else, so it stays as light
+# as it can: requests and responses are marshalled dicts over the bare
+# _socket module, since socket and json take longer to import than the
+# server takes to answer.
+
+import _socket
+import marshal
+import os
+import sys
+
+# Environment the server should see while running a command; symfile reads
+# GBD_SYM, and it has to be the caller's, not the server's.
+ENVIRONMENT = ("GBD_SYM",)
+
+def socket_path():
+    # $GBD_SOCKET, or gbd-<uid>.sock in the temp directory.  Worked out by
+    # hand, since importing tempfile costs more than a forwarded call.
+    if os.environ.get("GBD_SOCKET"):
+        return os.environ["GBD_SOCKET"]
+    tmp = os.environ.get("TMPDIR") or os.environ.get("TEMP") or os.environ.get("TMP") or "/tmp"
+    return os.path.join(tmp, f"gbd-{os.getuid()}.sock")
+
+def forward(argv):
+    # Runs argv on the server and returns True, or returns False if there's
+    # no server or it didn't answer properly, so the caller runs it itself.
+    path = socket_path()
+    if not os.path.exists(path):
+        return False
+    request = {"argv": argv, "cwd": os.getcwd(),
+               "env": {name: os.environ.get(name) for name in ENVIRONMENT}}
+    try:
+        client = _socket.socket(_socket.AF_UNIX, _socket.SOCK_STREAM)
+        try:
+            client.connect(path)
+            client.sendall(marshal.dumps(request))
+            client.shutdown(_socket.SHUT_WR)
+            response = b""
+            while True:
+                chunk = client.recv(1 << 16)
+                if not chunk:
+                    break
+                response += chunk
+        finally:
+            client.close()
+        response = marshal.loads(response)
+        out, err, status = response["out"], response["err"], response["status"]
+    except (OSError, EOFError, ValueError, KeyError, TypeError):
+        return False
+    sys.stdout.write(out)
+    sys.stderr.write(err)
+    if status:
+        sys.exit(status)
+    return True
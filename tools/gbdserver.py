@@ -0,0 +1,121 @@
+#!/usr/bin/python3
+
+# gbdserver keeps ROMs and their symbol tables loaded between gbd/gbaddr calls.
+# Start it once per session:
+#
+#   $ python3 gbdserver.py &
+#
+# and gbd.py notices the socket and hands its command line over instead of
+# mapping the ROM and parsing the .sym file itself, so the usual
+#
+#   $ gbd hm3.gbc 00:26E7 dw 16 State
+#
+# keeps working, just faster.  The socket lives at $GBD_SOCKET, or
+# gbd-<uid>.sock in the temp directory; the client side is gbdclient.py,
+# which gbaddr.py uses as well.  There's also a REPL on stdin, which
+# skips the per-command interpreter startup altogether:
+#
+#   $ python3 gbdserver.py -i
+#   > gbd hm3.gbc 7b:4427 dwb 0x14 Tilemap
+#   > gbaddr 7b:4427
+
+import contextlib
+import io
+import marshal
+import os
+import shlex
+import socket
+import sys
+
+from gbdclient import ENVIRONMENT, socket_path
+
+def run(argv, out, err):
+    # Runs one gbd/gbaddr command line, returning its exit status.
+    import gbaddr
+    import gbd
+    with contextlib.redirect_stdout(out), contextlib.redirect_stderr(err):
+        try:
+            if argv and argv[0] == "gbd":
+                gbd.main(argv, out=out)
+            elif argv and argv[0] == "gbaddr":
+                if any(arg in ("-f", "-b") for arg in argv[1:]):
+                    print("gbaddr -f/-b filters stdin; run gbaddr.py itself for that", file=err)
+                    return 1
+                gbaddr.main(argv[1:], out=out)
+            else:
+                print(f"Unknown command {argv[0] if argv else ''}", file=err)
+                return 1
+        except SystemExit as ex:
+            if isinstance(ex.code, str):
+                print(ex.code, file=err)
+                return 1
+            return ex.code or 0
+        except Exception as ex:
+            print(f"{type(ex).__name__}: {ex}", file=err)
+            return 1
+    return 0
+
+def handle(connection):
+    with connection:
+        request = b""
+        while True:
+            chunk = connection.recv(1 << 16)
+            if not chunk:
+                break
+            request += chunk
+        out, err = io.StringIO(), io.StringIO()
+        try:
+            request = marshal.loads(request)
+            argv, cwd, env = request["argv"], request["cwd"], request.get("env", {})
+            # One command at a time, so changing directory and environment
+            # to the client's is safe.
+            os.chdir(cwd)
+            for name in ENVIRONMENT:
+                if env.get(name) is None:
+                    os.environ.pop(name, None)
+                else:
+                    os.environ[name] = env[name]
+        except (EOFError, ValueError, KeyError, TypeError, AttributeError, OSError) as ex:
+            print(f"Bad request: {type(ex).__name__}: {ex}", file=err)
+            status = 1
+        else:
+            status = run(argv, out, err)
+        response = {"out": out.getvalue(), "err": err.getvalue(), "status": status}
+        connection.sendall(marshal.dumps(response))
+
+def serve(path):
+    if os.path.exists(path):
+        os.unlink(path)
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(path)
+    server.listen(16)
+    print(f"gbdserver listening on {path}", file=sys.stderr)
+    try:
+        while True:
+            connection, _ = server.accept()
+            try:
+                handle(connection)
+            except (OSError, ValueError) as ex:
+                print(f"Bad request: {ex}", file=sys.stderr)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+        os.unlink(path)
+
+def repl():
+    while True:
+        try:
+            line = input("> " if sys.stdin.isatty() else "")
+        except EOFError:
+            break
+        argv = shlex.split(line)
+        if argv:
+            run(argv, sys.stdout, sys.stderr)
+            sys.stdout.flush()
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "-i":
+        repl()
+    else:
+        serve(socket_path())
@@ -0,0 +1,143 @@
+#!/usr/bin/python3
+
+# png2gb goes the other way from gb2pgm: it turns PNGs (paletted or not) back
+# into GB 2bpp for reinsertion.  Every pixel is mapped to the nearest of the
+# four DMG shades, or, given a file of CGB palettes, each tile to whichever
+# palette fits it best.
+#
+#   $ python3 png2gb.py title.png                  # title.2bpp
+#   $ python3 png2gb.py -d title.png               # + title.tilemap
+#   $ python3 png2gb.py -d -f -p title.pal title/  # + title.attrmap
+#
+# -d writes only the unique tiles, plus a tilemap of one tile number per
+# byte (-b sets the first tile number).  -f also counts flipped tiles as the
+# same (so implies -d), and writes a CGB attribute map with the flip,
+# palette and VRAM bank bits; so does -p, with or without -d.  A palette
+# file has one palette a line, as four BGR555 words:
+#
+#   7fff 5ad6 294a 0000
+#
+# Directories are converted PNG by PNG, skipping ones that haven't changed.
+
+import functools
+import sys
+
+import numpy as np
+import png
+
+import batch
+import tiles
+
+# The DMG shades, lightest first.
+DMG_PALETTE = np.array([[[255, 255, 255], [170, 170, 170], [85, 85, 85], [0, 0, 0]]])
+
+def read_rgb(path):
+    # (height, width, 3) array of colors, height and width padded to whole tiles.
+    reader = png.Reader(filename=path)
+    width, height, rows, info = reader.asRGB8()
+    image = np.array([np.frombuffer(bytes(row), dtype=np.uint8) for row in rows]).reshape(height, width, 3)
+    padded = np.zeros((-(-height // 8) * 8, -(-width // 8) * 8, 3), dtype=np.uint8)
+    padded[:] = image[0, 0]
+    padded[:height, :width] = image
+    return padded
+
+def read_palettes(path):
+    # (palettes, colors, 3) array.  Short lines are padded with their last
+    # color, which quantize never picks over the real one.
+    palettes = []
+    with open(path) as f:
+        for line in f:
+            line = line.split(';')[0].split('#')[0].split()
+            if line:
+                palettes.append([int(word, 16) for word in line])
+    if not palettes:
+        sys.exit('No palettes in {}'.format(path))
+    width = max(len(palette) for palette in palettes)
+    palettes = [palette + palette[-1:] * (width - len(palette)) for palette in palettes]
+    return tiles.BGR555[np.array(palettes) & 0x7fff]
+
+def rgb_tiles(image):
+    height, width = image.shape[:2]
+    return image.reshape(height // 8, 8, width // 8, 8, 3).transpose(0, 2, 1, 3, 4).reshape(-1, 64, 3)
+
+def quantize(pixels, palettes, chunk=4096):
+    # Color indices (n, 8, 8) and palette numbers (n,) for (n, 64, 3) tiles,
+    # picking for each tile the palette with the least total error.  Works a
+    # chunk of tiles and one palette at a time, to keep memory bounded.
+    indices = np.zeros((len(pixels), 64), dtype=np.uint8)
+    palette = np.zeros(len(pixels), dtype=np.uint8)
+    colors = palettes.astype(np.int32)
+    for start in range(0, len(pixels), chunk):
+        block = pixels[start:start+chunk].astype(np.int32)
+        best_error = np.full(len(block), np.iinfo(np.int64).max, dtype=np.int64)
+        for number, entries in enumerate(colors):
+            difference = block[:, :, None, :] - entries[None, None]
+            distance = (difference * difference).sum(axis=3)        # (chunk, 64, colors)
+            nearest = distance.argmin(axis=2)
+            error = np.take_along_axis(distance, nearest[:, :, None], axis=2).sum(axis=(1, 2))
+            better = error < best_error
+            best_error[better] = error[better]
+            indices[start:start+chunk][better] = nearest[better]
+            palette[start:start+chunk][better] = number
+    return indices.reshape(-1, 8, 8), palette
+
+def check_size(name, numbers, attributes):
+    # Tile numbers are a byte; CGB attribute bit 3 picks VRAM bank 1 for the
+    # next 256.
+    limit = 0x200 if attributes else 0x100
+    if len(numbers) and numbers.max() >= limit:
+        print('{}: tile numbers up to {:#x}, more than {} can hold'.format(
+            name, int(numbers.max()), 'both VRAM banks' if attributes else 'a tilemap byte (-p or -f for CGB)'))
+
+def convert(f, palettes=DMG_PALETTE, dedupe=False, flips=False, attributes=False, base=0):
+    image = read_rgb(f)
+    indices, palette = quantize(rgb_tiles(image), palettes)
+    tileset = tiles.TileSet(indices)
+    name = f[:f.rfind('.')]
+    outputs = []
+    numbers = np.arange(len(tileset)) + base
+    flip = np.zeros(len(tileset), dtype=np.uint8)
+    if dedupe:
+        tileset, tilemap, flip = tiles.dedupe(tileset, flips)
+        numbers = tilemap + base
+        with open(name + '.tilemap', 'wb') as g:
+            g.write((numbers & 0xff).astype(np.uint8).tobytes())
+        outputs.append(name + '.tilemap')
+    if dedupe or attributes:
+        check_size(name, numbers, attributes)
+    if attributes:
+        # CGB BG attributes, one per tile of the image: palette in bits 0-2,
+        # VRAM bank bit 3, hflip bit 5, vflip bit 6.
+        attrs = (palette & 7) | ((numbers >> 8 & 1) << 3) | ((flip & 1) << 5) | ((flip >> 1) << 6)
+        with open(name + '.attrmap', 'wb') as g:
+            g.write(attrs.astype(np.uint8).tobytes())
+        outputs.append(name + '.attrmap')
+    with open(name + '.2bpp', 'wb') as g:
+        g.write(tileset.encode('2bpp'))
+    outputs.insert(0, name + '.2bpp')
+    print('Wrote {} ({} tiles)'.format(name + '.2bpp', len(tileset)))
+    return outputs
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    options = {'palettes': DMG_PALETTE}
+    while args and args[0].startswith('-'):
+        flag = args.pop(0)
+        if flag == '-d':
+            options['dedupe'] = True
+        elif flag == '-f':
+            # Flipped tiles only count as the same when there's a tilemap.
+            options['flips'] = options['attributes'] = options['dedupe'] = True
+        elif flag == '-p' and args:
+            options['palettes'] = read_palettes(args.pop(0))
+            options['attributes'] = True
+        elif flag == '-b' and args:
+            options['base'] = int(args.pop(0), 0)
+        else:
+            args = []
+            break
+    if not args:
+        sys.exit('usage: python3 png2gb.py [-d] [-f] [-p palettes] [-b first_tile] image.png|directory...')
+    job = functools.partial(convert, **options)
+    for arg in args:
+        batch.convert_path(arg, job, '.2bpp', 'png2gb', accept='.png', options=batch.describe(options))
@@ -0,0 +1,148 @@
+#!/usr/bin/python3
+
+# png2gba imports PNGs as GBA backgrounds: a 4bpp or 8bpp tileset with every
+# tile stored once, even flipped, and a tilemap of screen entries (tile
+# number, hflip bit 10, vflip bit 11, palette bank in bits 12-15).
+#
+#   $ python3 png2gba.py title.png                 # title.4bpp, title.tilemap
+#   $ python3 png2gba.py -8 title.png              # title.8bpp, title.tilemap
+#   $ python3 png2gba.py -s bg.4bpp screens/       # one tileset for them all
+#
+# Paletted PNGs are taken as they are: in 4bpp, color n is color n % 16 of
+# bank n // 16, and a tile's colors must all be in one bank.  Grayscale is
+# read as gba2png writes it, index*16 for 4bpp and the index itself for
+# 8bpp.  Anything else needs -p, a file of up to sixteen palettes, one bank
+# a line of up to sixteen BGR555 words, and every tile gets the bank that
+# fits it best.  8bpp backgrounds have no palette bits, so there the bank
+# picks which sixteen of the 256 colors the tile uses instead.
+#
+# -s pools the tiles of every image it's given into one tileset, so tiles
+# shared between screens are stored once, and writes only tilemaps next to
+# the images.  Otherwise directories are converted PNG by PNG, skipping ones
+# that haven't changed.  -b sets the first tile number; -n turns off flips.
+
+import functools
+import os
+import sys
+
+import numpy as np
+import png
+
+import batch
+import png2gb
+import tiles
+
+MAX_TILES = 1024
+
+def read_indices(path, format):
+    # (height, width) array of color indices.
+    width, height, rows, info = png.Reader(filename=path).read()
+    planes = info['planes']
+    pixels = np.array([list(row) for row in rows], dtype=np.int64).reshape(height, width, planes)
+    if 'palette' in info:
+        return pixels[:, :, 0].astype(np.uint8)
+    if info['greyscale']:
+        gray = pixels[:, :, 0] * 255 // ((1 << info['bitdepth']) - 1)
+        return (gray // 16 if format == '4bpp' else gray).astype(np.uint8)
+    sys.exit('{} is in color; give its palettes with -p'.format(path))
+
+def read_tiles(path, format, palettes=None):
+    # (n, 8, 8) color indices and (n,) palette banks, row by row.
+    if palettes is not None:
+        indices, banks = png2gb.quantize(png2gb.rgb_tiles(png2gb.read_rgb(path)), palettes)
+        if format == '8bpp':
+            return indices + (banks[:, None, None] << 4), np.zeros(len(banks), dtype=np.uint8)
+        return indices, banks
+    image = read_indices(path, format)
+    height, width = image.shape
+    padded = np.zeros((-(-height // 8) * 8, -(-width // 8) * 8), dtype=np.uint8)
+    padded[:height, :width] = image
+    height, width = padded.shape
+    pixels = padded.reshape(height // 8, 8, width // 8, 8).transpose(0, 2, 1, 3).reshape(-1, 8, 8)
+    return pixels, np.zeros(len(pixels), dtype=np.uint8)
+
+def split_banks(pixels, banks, format, path):
+    # 4bpp tiles carry their bank in the high nibble of paletted colors.
+    if format != '4bpp':
+        return pixels, banks
+    flat = pixels.reshape(len(pixels), -1)
+    low, high = flat.min(axis=1) >> 4, flat.max(axis=1) >> 4
+    mixed = np.flatnonzero(low != high)
+    if len(mixed):
+        sys.exit('{}: tile {} uses colors from more than one palette bank'.format(path, mixed[0]))
+    return pixels & 0x0f, banks | high.astype(np.uint8)
+
+def screen_entries(tilemap, flip, banks, base=0):
+    entries = ((tilemap + base) & 0x3ff) | (flip.astype(np.int64) << 10) | (banks.astype(np.int64) << 12)
+    return entries.astype('<u2').tobytes()
+
+def check_size(name, tileset, base):
+    if len(tileset) + base > MAX_TILES:
+        print('{}: {} tiles, more than a screen block can number'.format(name, len(tileset)))
+
+def convert(f, format='4bpp', palettes=None, flips=True, base=0):
+    pixels, banks = split_banks(*read_tiles(f, format, palettes), format=format, path=f)
+    tileset, tilemap, flip = tiles.dedupe(tiles.TileSet(pixels), flips)
+    name = f[:f.rfind('.')]
+    check_size(name, tileset, base)
+    with open(name + '.' + format, 'wb') as g:
+        g.write(tileset.encode(format))
+    with open(name + '.tilemap', 'wb') as g:
+        g.write(screen_entries(tilemap, flip, banks, base))
+    print('Wrote {} ({} of {} tiles)'.format(name + '.' + format, len(tileset), len(pixels)))
+    return [name + '.' + format, name + '.tilemap']
+
+def convert_shared(paths, out, format='4bpp', palettes=None, flips=True, base=0):
+    # One tileset for every image, deduplicated all at once.
+    images = []
+    for path in paths:
+        if os.path.isdir(path):
+            images += [os.path.join(path, f) for f in sorted(os.listdir(path))
+                       if f.endswith('.png') and not f.startswith('.')]
+        else:
+            images.append(path)
+    read = [split_banks(*read_tiles(f, format, palettes), format=format, path=f) for f in images]
+    if not read:
+        sys.exit('No images')
+    pixels = np.concatenate([p for p, b in read])
+    tileset, tilemap, flip = tiles.dedupe(tiles.TileSet(pixels), flips)
+    check_size(out, tileset, base)
+    with open(out, 'wb') as g:
+        g.write(tileset.encode(format))
+    start = 0
+    for f, (p, banks) in zip(images, read):
+        end = start + len(p)
+        with open(f[:f.rfind('.')] + '.tilemap', 'wb') as g:
+            g.write(screen_entries(tilemap[start:end], flip[start:end], banks, base))
+        start = end
+    print('Wrote {} ({} of {} tiles, {} tilemaps)'.format(out, len(tileset), len(pixels), len(images)))
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    options = {}
+    shared = None
+    while args and args[0].startswith('-'):
+        flag = args.pop(0)
+        if flag == '-8':
+            options['format'] = '8bpp'
+        elif flag == '-n':
+            options['flips'] = False
+        elif flag == '-p' and args:
+            options['palettes'] = png2gb.read_palettes(args.pop(0))
+            if options['palettes'].shape[0] > 16 or options['palettes'].shape[1] > 16:
+                sys.exit('At most sixteen palettes of sixteen colors')
+        elif flag == '-b' and args:
+            options['base'] = int(args.pop(0), 0)
+        elif flag == '-s' and args:
+            shared = args.pop(0)
+        else:
+            args = []
+            break
+    if not args:
+        sys.exit('usage: python3 png2gba.py [-8] [-n] [-p palettes] [-b first_tile] [-s tileset] image.png|directory...')
+    if shared:
+        convert_shared(args, shared, **options)
+    else:
+        job = functools.partial(convert, **options)
+        for arg in args:
+            batch.convert_path(arg, job, '.tilemap', 'png2gba', accept='.png', options=batch.describe(options))
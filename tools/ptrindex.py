@@ -0,0 +1,142 @@
+#!/usr/bin/python3
+
+# ptrindex answers "who points at this?" for a GB ROM, which is what you need
+# to know before moving a string or a graphic.  It records every candidate
+# pointer in the ROM, at every byte offset:
+#
+#  - near: a 4000-7FFF word, resolved against the bank it sits in (the per-bank
+#    text pointers medarot/dump.py and final_inserter.py deal with), plus home
+#    bank 0000-3FFF words;
+#  - far: a three-byte bank+pointer in either bw or wb order (hp_decmp.py,
+#    rip_encounters.py, punika.py).
+#
+# Each kind is kept as two parallel uint32 arrays sorted by target, so lookups
+# are a searchsorted away.  The index is saved next to the ROM, keyed by the
+# ROM's SHA-1, and rebuilt only when the ROM changes.
+#
+#   $ python3 ptrindex.py telefang.gbc 1d:4a3c
+#   near 1d:4a3c <- 1d:4002
+#   $ python3 ptrindex.py telefang.gbc 1d:4a00 1d:4b00
+
+import glob
+import hashlib
+import os
+import sys
+
+import numpy as np
+
+from gbaddr import gbaddr, gbswitch
+from romimage import RomImage
+
+BANK_SIZE = 0x4000
+INDEX_VERSION = 1
+
+def _sorted_pairs(targets, sources):
+    order = np.argsort(targets, kind="stable")
+    return targets[order].astype(np.uint32), sources[order].astype(np.uint32)
+
+def build(data):
+    data = np.asarray(data, dtype=np.uint8)
+    n = len(data)
+    numbanks = max(1, n // BANK_SIZE)
+    lo = data[:-1].astype(np.int64)
+    hi = data[1:].astype(np.int64)
+    words = lo | (hi << 8)
+    sources = np.arange(n-1, dtype=np.int64)
+    banks = sources // BANK_SIZE
+    # Words straddling a bank boundary can't be pointers.
+    inside = (sources % BANK_SIZE) != BANK_SIZE-1
+
+    home = inside & (words < 0x4000)
+    switched = inside & (words >= 0x4000) & (words < 0x8000) & (banks > 0)
+    near_targets = np.concatenate([words[home], banks[switched]*BANK_SIZE + words[switched] - BANK_SIZE])
+    near_sources = np.concatenate([sources[home], sources[switched]])
+
+    # Far pointers: bank byte before (bw) or after (wb) the word.
+    far_targets = []
+    far_sources = []
+    m = n - 2
+    src = sources[:m]
+    for bank_byte, word in ((data[:m], words[1:m+1]), (data[2:], words[:m])):
+        bank_byte = bank_byte.astype(np.int64)
+        ok = ((word >= 0x4000) & (word < 0x8000) & (bank_byte > 0) & (bank_byte < numbanks) &
+              ((src % BANK_SIZE) <= BANK_SIZE-3))
+        far_targets.append(bank_byte[ok]*BANK_SIZE + word[ok] - BANK_SIZE)
+        far_sources.append(src[ok])
+    far_targets = np.concatenate(far_targets)
+    far_sources = np.concatenate(far_sources)
+
+    return {
+        "near": _sorted_pairs(near_targets, near_sources),
+        "far": _sorted_pairs(far_targets, far_sources),
+    }
+
+class PointerIndex(object):
+    def __init__(self, tables):
+        self.tables = tables
+
+    def references(self, target, kinds=("near", "far")):
+        return self.references_into(target, target+1, kinds)
+
+    def references_into(self, start, end, kinds=("near", "far")):
+        # Every (kind, source, target) with start <= target < end.
+        found = []
+        for kind in kinds:
+            targets, sources = self.tables[kind]
+            # Keys must match the table's dtype, or numpy converts the table.
+            i, j = np.searchsorted(targets, np.array([start, end], dtype=np.uint32))
+            found.extend((kind, int(s), int(t)) for t, s in zip(targets[i:j], sources[i:j]))
+        return found
+
+    def save(self, path):
+        np.savez_compressed(path, version=INDEX_VERSION,
+                            near_targets=self.tables["near"][0], near_sources=self.tables["near"][1],
+                            far_targets=self.tables["far"][0], far_sources=self.tables["far"][1])
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as f:
+            if int(f["version"]) != INDEX_VERSION:
+                raise ValueError("stale index")
+            return cls({
+                "near": (f["near_targets"], f["near_sources"]),
+                "far": (f["far_targets"], f["far_sources"]),
+            })
+
+def index_path(rom_path, digest):
+    return f"{rom_path}.{digest[:12]}.ptridx.npz"
+
+def open_index(rom):
+    # Loads the index saved next to the ROM, building it first if needed.
+    digest = hashlib.sha1(rom.data).hexdigest()
+    path = index_path(rom.path, digest)
+    if os.path.exists(path):
+        try:
+            return PointerIndex.load(path)
+        except (OSError, ValueError, KeyError):
+            pass
+    index = PointerIndex(build(np.frombuffer(rom.data, dtype=np.uint8)))
+    # Indexes of earlier versions of this ROM are no use any more.
+    for stale in glob.glob(glob.escape(rom.path) + "." + "[0-9a-f]" * 12 + ".ptridx.npz"):
+        if stale != path:
+            try:
+                os.remove(stale)
+            except OSError:
+                pass
+    try:
+        index.save(path)
+    except OSError:
+        pass
+    return index
+
+if __name__ == "__main__":
+    if len(sys.argv) not in (3, 4):
+        sys.exit("usage: python3 ptrindex.py rom.gbc address [end]")
+    rom = RomImage(sys.argv[1])
+    index = open_index(rom)
+    start = gbaddr(sys.argv[2])
+    end = gbaddr(sys.argv[3]) if len(sys.argv) > 3 else start+1
+    if not isinstance(start, int) or not isinstance(end, int):
+        sys.exit("Failed to convert address.  Please check your ranges.")
+    for kind, source, target in index.references_into(start, end):
+        print(f"{kind} {gbswitch(target)} <- {gbswitch(source)}")
@@ -0,0 +1,131 @@
+#!/usr/bin/python3
+
+# ptrscan sweeps a whole GB ROM for things that look like pointer tables:
+# runs of bank-local words in 4000-7FFF (at both byte alignments), and runs of
+# three-byte far pointers in either wb (pointer, bank) or bw (bank, pointer)
+# order with plausible banks.  Every run is scored by how many of its targets
+# are distinct and land in the bank outside the table itself (far pointers
+# also by how few banks they spread over, since real tables point into a
+# handful of banks and noise points everywhere).  Overlapping readings of the
+# same bytes are resolved in favour of the best one, and the survivors are
+# printed as gbd manifest lines, so they can be fed straight to gbd -m.
+#
+#   $ python3 ptrscan.py hp2.gbc 8 0.75 > candidates.txt
+#   09:5000 b,w 0x800 ; score 0.97
+#   ...
+
+import sys
+
+import numpy as np
+
+from gbaddr import gbswitch
+from romimage import RomImage
+
+BANK_SIZE = 0x4000
+MIN_LENGTH = 12
+MIN_SCORE = 0.5
+
+def runs(valid, banks):
+    # (start, length) of every run of consecutive valid entries that stays
+    # within one bank.
+    same = np.zeros(len(valid), dtype=bool)
+    same[1:] = valid[1:] & valid[:-1] & (banks[1:] == banks[:-1])
+    starts = np.flatnonzero(valid & ~same)
+    ends = np.flatnonzero(valid & ~np.append(same[1:], False)) + 1
+    return starts, ends - starts
+
+def ascending(targets):
+    # How many targets come after the one before them.  Tables are mostly
+    # laid out in order, and a far table read with its banks paired to the
+    # wrong words isn't, wherever the banks change.
+    return float((targets[1:] > targets[:-1]).mean()) if len(targets) > 1 else 0.0
+
+def word_tables(data, min_length):
+    found = []
+    for phase in (0, 1):
+        n = (len(data) - phase) // 2
+        words = data[phase:phase+2*n].view("<u2")
+        offsets = phase + 2*np.arange(n)
+        banks = offsets // BANK_SIZE
+        # A word straddling a bank boundary can't be a table entry.
+        valid = (words >= 0x4000) & (words < 0x8000) & (offsets % BANK_SIZE != BANK_SIZE-1)
+        starts, lengths = runs(valid, banks)
+        keep = lengths >= min_length
+        for start, length in zip(starts[keep], lengths[keep]):
+            table = words[start:start+length].astype(np.int64)
+            offset = int(offsets[start])
+            bank = offset // BANK_SIZE
+            distinct = len(np.unique(table)) / length
+            if bank:
+                targets = bank*BANK_SIZE + table - 0x4000
+                outside = (targets < offset) | (targets >= offset + 2*length)
+                inbank = outside.mean()
+            else:
+                # Home bank tables don't say which bank they point into.
+                inbank = 1.0
+            found.append((offset, "dw", int(length), distinct*inbank, ascending(table)))
+    return found
+
+def far_tables(data, min_length):
+    found = []
+    numbanks = max(1, len(data) // BANK_SIZE)
+    for order in ("wb", "bw"):
+        for phase in (0, 1, 2):
+            n = (len(data) - phase) // 3
+            records = data[phase:phase+3*n].reshape(n, 3).astype(np.int64)
+            if order == "wb":
+                pointers = records[:, 0] | (records[:, 1] << 8)
+                targets_bank = records[:, 2]
+            else:
+                pointers = records[:, 1] | (records[:, 2] << 8)
+                targets_bank = records[:, 0]
+            offsets = phase + 3*np.arange(n)
+            banks = offsets // BANK_SIZE
+            valid = ((pointers >= 0x4000) & (pointers < 0x8000) &
+                     (targets_bank > 0) & (targets_bank < numbanks) &
+                     (offsets % BANK_SIZE <= BANK_SIZE-3))
+            starts, lengths = runs(valid, banks)
+            keep = lengths >= min_length
+            for start, length in zip(starts[keep], lengths[keep]):
+                targets = (targets_bank[start:start+length]*BANK_SIZE +
+                           pointers[start:start+length] - 0x4000)
+                offset = int(offsets[start])
+                distinct = len(np.unique(targets)) / length
+                outside = (targets < offset) | (targets >= offset + 3*length)
+                spread = 1 - (len(np.unique(targets_bank[start:start+length])) - 1) / length
+                found.append((offset, order, int(length), distinct*outside.mean()*spread, ascending(targets)))
+    return found
+
+ENTRY_SIZE = {"dw": 2, "wb": 3, "bw": 3}
+# Last resort between equally good readings: bank first is how the far
+# pointers in this repo's games are stored (hp_decmp, punika).
+PREFERENCE = {"bw": 0, "wb": 1, "dw": 2}
+
+def scan(rom, min_length=MIN_LENGTH, min_score=MIN_SCORE):
+    data = np.frombuffer(rom.data, dtype=np.uint8)
+    found = word_tables(data, min_length) + far_tables(data, min_length)
+    found = [candidate for candidate in found if candidate[3] >= min_score]
+    # The same table also reads as a shorter table of another kind one byte
+    # over; keep whichever explains the most bytes best.  A bw table also
+    # reads as a wb table two bytes earlier, often just as well; ties go to
+    # the reading whose targets are more in order, then by PREFERENCE.
+    claimed = np.zeros(len(data), dtype=bool)
+    kept = []
+    ranked = sorted(found, key=lambda c: (-c[3]*c[2], -c[4], PREFERENCE[c[1]], c[0]))
+    for offset, format, length, score, order in ranked:
+        end = offset + length*ENTRY_SIZE[format]
+        if not claimed[offset:end].any():
+            claimed[offset:end] = True
+            kept.append((offset, format, length, score))
+    return sorted(kept)
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        sys.exit("usage: python3 ptrscan.py rom.gbc [min_length] [min_score]")
+    rom = RomImage(sys.argv[1])
+    min_length = int(sys.argv[2], 0) if len(sys.argv) > 2 else MIN_LENGTH
+    min_score = float(sys.argv[3]) if len(sys.argv) > 3 else MIN_SCORE
+    # gbd has no dbw, but the equivalent record spec does the same job.
+    formats = {"dw": "dw", "wb": "dwb", "bw": "b,w"}
+    for offset, format, length, score in scan(rom, min_length, min_score):
+        print(f"{gbswitch(offset)} {formats[format]} {length:#x} ; score {score:.2f}")
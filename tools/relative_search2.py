@@ -1,23 +1,92 @@
-#!/bin/pypy
+#!/usr/bin/python3
 
-alphabet = "ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+# relative_search2 finds text whose encoding is unknown but keeps the
+# alphabet in order, like relative_search.c, for any number of strings at
+# once.  Only the differences between neighbouring letters are compared, so
+# the ROM's byte deltas are worked out once per file and each string becomes
+# a single pattern to find in them, whatever the charset's offset is.
+#
+#   $ python3 relative_search2.py -s HARRY -s Hogwarts hp1.gbc hp2.gbc
+#    8-bit string HARRY found in file hp1.gbc, pos 0x8f012, offset by 0xe7
+#   16-bit string Hogwarts found in file hp2.gbc, pos 0x1a2b40, offset by 0x20
+#
+# 16-bit strings have one character every other byte, whatever the byte in
+# between.  Strings are taken exactly as given, by their ASCII codes, so
+# "Hogwarts" and "HOGWARTS" are different searches.  "offset by" is the
+# first letter's ASCII code minus the byte it was found as, as in
+# relative_search.c.
 
-from sys import argv
+import re
+import sys
 
+import numpy as np
 
-text = argv[1]
-file = open(argv[2], 'rb')
+from romimage import RomImage
 
-test_strings = []
-for n in range(255):
-    test_strings.append( "".join(chr((alphabet.find(char.upper())+n)%256) for char in text))
+STRIDES = (1, 2)
 
-data = file.read()
+def codes(text):
+    return bytes(ord(c) & 0xff for c in text)
 
-print argv[2], hex(len(data))
+def query_deltas(text):
+    q = np.frombuffer(codes(text), dtype=np.uint8)
+    return (q[1:] - q[:-1]).tobytes()
 
-for i in range(len(data)-len(text)):
-    testing_against = data[i:i+len(text)]
-    for n, test_string in enumerate(test_strings):
-        if testing_against == test_string:
-            print "Found at", i, "offset by", n, "as", test_string
+def deltas(data, stride):
+    # [(phase, delta stream)] for every phase of `stride`; delta i of the
+    # stream at `phase` is data[phase + (i+1)*stride] - data[phase + i*stride].
+    raw = np.frombuffer(data, dtype=np.uint8)
+    streams = []
+    for phase in range(stride):
+        column = raw[phase::stride]
+        streams.append((phase, (column[1:] - column[:-1]).tobytes()))
+    del raw, column
+    return streams
+
+def search(data, texts):
+    # Yields (stride, pos, text, offset) for every string found in data.
+    patterns = {}
+    for text in texts:
+        patterns.setdefault(query_deltas(text), []).append(text)
+    # One pass per stream finds every position where any string might start,
+    # longest first so that shared prefixes don't hide the longer string.
+    keys = sorted(patterns, key=len, reverse=True)
+    finder = re.compile(b'(?=' + b'|'.join(re.escape(k) for k in keys) + b')', re.DOTALL)
+    for stride in STRIDES:
+        for phase, stream in deltas(data, stride):
+            for match in finder.finditer(stream):
+                i = match.start()
+                pos = phase + i*stride
+                for key in keys:
+                    if stream.startswith(key, i):
+                        for text in patterns[key]:
+                            yield stride, pos, text, (codes(text)[0] - data[pos]) & 0xff
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    texts = []
+    verbose = False
+    while args and args[0].startswith('-'):
+        flag = args.pop(0)
+        if flag == '-s' and args:
+            texts.append(args.pop(0))
+        elif flag == '-v':
+            verbose = True
+        else:
+            args = []
+            break
+    if not texts and args:
+        texts.append(args.pop(0))
+    if not texts or not args:
+        sys.exit('usage: python3 relative_search2.py [-v] string|-s string [-s string...] file...')
+    short = [text for text in texts if len(text) < 2]
+    if short:
+        sys.exit('Strings need at least two characters: {}'.format(', '.join(short)))
+    for filename in args:
+        if verbose:
+            print('Looking for {} in {}'.format(', '.join(texts), filename))
+        rom = RomImage(filename)
+        for stride, pos, text, offset in search(rom.data, texts):
+            print('{:>2}-bit string {} found in file {}, pos 0x{:x}, offset by 0x{:x}'.format(
+                stride*8, text, filename, pos, offset))
+        rom.close()
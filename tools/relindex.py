@@ -0,0 +1,157 @@
+#!/usr/bin/python3
+
+# relindex is relative search for a corpus of ROMs that gets searched over
+# and over.  Building the index works out the 8-bit and 16-bit byte-delta
+# streams of every ROM once (as relative_search2 does per run) and sorts
+# every position in them by the deltas that follow it, a suffix array; a
+# search is then two binary searches, whatever the size of the corpus.
+#
+#   $ python3 relindex.py -b corpus.idx hp1.gbc hp2.gbc medarot/ telefang/
+#   Indexed 9 ROMs, 41234567 positions
+#   $ python3 relindex.py corpus.idx HARRY Hogwarts
+#    8-bit string HARRY found in file hp1.gbc, pos 0x8f012, offset by 0xe7
+#
+# The suffix array is sorted on the first eight deltas; longer strings are
+# checked against the stored streams past that.  The index is a directory of
+# .npy files that searches memory-map, so nothing is read in up front.  ROMs
+# that changed since the index was built are pointed out; build it again.
+
+import json
+import os
+import sys
+
+import numpy as np
+
+from relative_search2 import STRIDES, codes, deltas, query_deltas
+from romimage import RomImage
+
+INDEX_VERSION = 1
+DEPTH = 8
+EXTENSIONS = ('.gb', '.gbc', '.gba', '.sgb')
+
+def roms(paths):
+    for path in paths:
+        if os.path.isdir(path):
+            for f in sorted(os.listdir(path)):
+                if f.lower().endswith(EXTENSIONS) and not f.startswith('.'):
+                    yield os.path.join(path, f)
+        else:
+            yield path
+
+def stamp(path):
+    st = os.stat(path)
+    return {'path': os.path.abspath(path), 'size': st.st_size, 'mtime': st.st_mtime}
+
+def build(paths):
+    files = []
+    streams = []
+    chunks = []
+    start = 0
+    for path in roms(paths):
+        rom = RomImage(path)
+        for stride in STRIDES:
+            for phase, stream in deltas(rom.data, stride):
+                streams.append((len(files), stride, phase, start, len(stream)))
+                chunks.append(stream)
+                start += len(stream)
+        rom.close()
+        files.append(stamp(path))
+    # Padding so every position has DEPTH deltas after it; positions whose
+    # deltas run into the next stream are weeded out when searching.
+    data = np.frombuffer(b''.join(chunks) + bytes(DEPTH), dtype=np.uint8)
+    n = start
+    keys = np.zeros(n, dtype=np.uint64)
+    for j in range(DEPTH):
+        keys |= data[j:j+n].astype(np.uint64) << np.uint64(8*(DEPTH-1-j))
+    suffixes = np.argsort(keys, kind='stable').astype(np.uint32)
+    del keys
+    return RelativeIndex(files, np.array(streams, dtype=np.int64).reshape(-1, 5), data, suffixes)
+
+class RelativeIndex(object):
+    def __init__(self, files, streams, data, suffixes):
+        self.files = files
+        self.streams = streams
+        self.data = data
+        self.suffixes = suffixes
+
+    def save(self, path):
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, 'deltas.npy'), self.data)
+        np.save(os.path.join(path, 'suffixes.npy'), self.suffixes)
+        np.save(os.path.join(path, 'streams.npy'), self.streams)
+        with open(os.path.join(path, 'index.json'), 'w') as f:
+            json.dump({'version': INDEX_VERSION, 'files': self.files}, f, indent=0)
+
+    @classmethod
+    def load(cls, path):
+        with open(os.path.join(path, 'index.json')) as f:
+            info = json.load(f)
+        if info['version'] != INDEX_VERSION:
+            raise ValueError('stale index')
+        return cls(info['files'],
+                   np.load(os.path.join(path, 'streams.npy')),
+                   np.load(os.path.join(path, 'deltas.npy'), mmap_mode='r'),
+                   np.load(os.path.join(path, 'suffixes.npy'), mmap_mode='r'))
+
+    def stale(self):
+        return [f['path'] for f in self.files
+                if not os.path.exists(f['path']) or stamp(f['path']) != f]
+
+    def bound(self, key, upper):
+        # First suffix whose leading deltas are >= key (> key if upper).
+        lo, hi = 0, len(self.suffixes)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            p = int(self.suffixes[mid])
+            here = self.data[p:p+len(key)].tobytes()
+            if here < key or (upper and here == key):
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def find(self, text):
+        # [(file, stride, pos)] for every place the string's deltas occur.
+        key = query_deltas(text)
+        head = key[:DEPTH]
+        lo, hi = self.bound(head, False), self.bound(head, True)
+        candidates = np.sort(np.asarray(self.suffixes[lo:hi], dtype=np.int64))
+        streams = self.streams
+        which = np.searchsorted(streams[:, 3], candidates, side='right') - 1
+        inside = candidates + len(key) <= streams[which, 3] + streams[which, 4]
+        found = []
+        for p, s in zip(candidates[inside], which[inside]):
+            if len(key) > DEPTH and self.data[p:p+len(key)].tobytes() != key:
+                continue
+            f, stride, phase, start, length = (int(v) for v in streams[s])
+            found.append((f, stride, phase + (int(p) - start)*stride))
+        return found
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    if len(args) >= 3 and args[0] == '-b':
+        index = build(args[2:])
+        index.save(args[1])
+        print('Indexed {} ROMs, {} positions'.format(len(index.files), len(index.suffixes)))
+        sys.exit()
+    if len(args) < 2:
+        sys.exit('usage: python3 relindex.py -b index rom|directory...\n'
+                 '       python3 relindex.py index string...')
+    index = RelativeIndex.load(args[0])
+    for path in index.stale():
+        print('{} has changed since it was indexed'.format(path), file=sys.stderr)
+    opened = {}
+    for text in args[1:]:
+        if len(text) < 2:
+            sys.exit('Strings need at least two characters: {}'.format(text))
+        for f, stride, pos in sorted(index.find(text)):
+            path = index.files[f]['path']
+            if f not in opened:
+                opened[f] = RomImage(path) if os.path.exists(path) else None
+            rom = opened[f]
+            offset = '0x{:x}'.format((codes(text)[0] - rom.u8(pos)) & 0xff) if rom and pos < len(rom) else '?'
+            print('{:>2}-bit string {} found in file {}, pos 0x{:x}, offset by {}'.format(
+                stride*8, text, os.path.relpath(path), pos, offset))
+    for rom in opened.values():
+        if rom:
+            rom.close()
@@ -0,0 +1,158 @@
+#!/usr/bin/python3
+
+# shapesearch finds known text in a ROM whose charset is in no useful order,
+# like the kana tables of medarot1.tbl or telefang's original.tbl, where
+# relative search gets nowhere.  It matches a string's shape instead: equal
+# characters have to be equal bytes and different characters different
+# bytes.  Every hit is a guess at part of the table, and the guesses of all
+# the strings are merged into the one table that agrees with the most of them.
+#
+#   $ python3 shapesearch.py -o medarot1.tbl medarot1.gb メダロットのロボトル ききききき
+#   メダロットのロボトル found at 0x4b2c1
+#   ききききき found at 0x5a012, 0x6d0e4
+#   2 of 2 strings agree on 9 entries
+#
+# Strings need repeated characters to have a shape at all; the longer and
+# more repetitive, the fewer false hits.  -t starts from a table already
+# known, and hits that disagree with it are dropped.  Tables are written in
+# the XX=char form the rippers read.
+
+import sys
+
+import numpy as np
+
+from romimage import RomImage
+
+# Strings with more hits than this say nothing about the table.
+MAX_HITS = 64
+
+def shape(seq):
+    # For every character, how far back its last occurrence is (0 if none).
+    last = {}
+    out = []
+    for i, c in enumerate(seq):
+        out.append(i - last[c] if c in last else 0)
+        last[c] = i
+    return out
+
+def previous(data):
+    # The same for every byte of the ROM, computed once for all strings;
+    # bytes never seen before get a distance longer than any string.
+    raw = np.frombuffer(data, dtype=np.uint8)
+    order = np.argsort(raw, kind='stable')
+    same = raw[order[1:]] == raw[order[:-1]]
+    prev = np.full(len(raw), len(raw) + 1, dtype=np.int64)
+    prev[order[1:][same]] = order[1:][same] - order[:-1][same]
+    del raw
+    return prev
+
+def find(prev, text):
+    # Offsets of every window of the ROM shaped like text.  The repeats are
+    # the rare part, so they narrow the candidates down first; after that
+    # only the surviving offsets are looked at.
+    s = shape(text)
+    limit = len(prev) - len(s) + 1
+    if limit <= 0:
+        return np.zeros(0, dtype=np.int64)
+    candidates = None
+    for i in sorted(range(len(s)), key=lambda i: s[i] == 0):
+        column = prev[i:i+limit] if candidates is None else prev[candidates + i]
+        ok = column == s[i] if s[i] else column > i
+        candidates = np.flatnonzero(ok) if candidates is None else candidates[ok]
+    return candidates
+
+def mapping(data, text, offset):
+    return {data[offset+i]: c for i, c in enumerate(text)}
+
+def consistent(table, entries):
+    # True if entries can join table: one character a byte, one byte a character.
+    chars = {c: b for b, c in table.items()}
+    for b, c in entries.items():
+        if table.get(b, c) != c or chars.get(c, b) != b:
+            return False
+    return True
+
+def merge(hits, known):
+    # hits: {text: [mapping]}.  Grows a table from every hit in turn, taking
+    # in each other string's first hit that fits, and keeps the table that
+    # explains the most strings, then has the most entries.
+    best, best_strings = dict(known), []
+    seeds = [(text, m) for text, ms in hits.items() for m in ms]
+    for seed_text, seed in seeds or [(None, {})]:
+        if not consistent(known, seed):
+            continue
+        table = dict(known)
+        table.update(seed)
+        strings = [seed_text] if seed_text else []
+        for text, ms in sorted(hits.items(), key=lambda item: len(item[1])):
+            if text == seed_text:
+                continue
+            for m in ms:
+                if consistent(table, m):
+                    table.update(m)
+                    strings.append(text)
+                    break
+        if (len(strings), len(table)) > (len(best_strings), len(best)):
+            best, best_strings = table, strings
+    return best, best_strings
+
+def read_table(path):
+    table = {}
+    for line in open(path, encoding='utf-8').readlines():
+        if line.strip():
+            a, b = line.strip('\n').split('=', 1)
+            table[int(a, 16)] = b.replace('\\n', '\n')
+    return table
+
+def write_table(table, out):
+    for b in sorted(table):
+        out.write('{:02X}={}\n'.format(b, table[b].replace('\n', '\\n')))
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    known = {}
+    output = None
+    while args and args[0].startswith('-'):
+        flag = args.pop(0)
+        if flag == '-t' and args:
+            known = read_table(args.pop(0))
+        elif flag == '-o' and args:
+            output = args.pop(0)
+        else:
+            args = []
+            break
+    if len(args) < 2:
+        sys.exit('usage: python3 shapesearch.py [-t known.tbl] [-o out.tbl] rom string...')
+    rom = RomImage(args[0])
+    prev = previous(rom.data)
+    hits = {}
+    for text in args[1:]:
+        if not any(shape(text)):
+            print('{} has no repeated characters, so it matches anywhere'.format(text))
+            continue
+        offsets = find(prev, text)
+        if not len(offsets):
+            print('{} not found'.format(text))
+            continue
+        print('{} found at {}'.format(text, ', '.join(hex(o) for o in offsets[:8]) +
+                                      (', ...' if len(offsets) > 8 else '')))
+        if len(offsets) > MAX_HITS:
+            print('  {} hits, too many to go on'.format(len(offsets)))
+            continue
+        # Hits that say the same thing count once.
+        ms = []
+        for o in offsets:
+            m = mapping(rom.data, text, int(o))
+            if m not in ms and consistent(known, m):
+                ms.append(m)
+        if ms:
+            hits[text] = ms
+    table, strings = merge(hits, known)
+    print('{} of {} strings agree on {} entries'.format(len(strings), len(args) - 1, len(table) - len(known)))
+    if output:
+        with open(output, 'w', encoding='utf-8') as f:
+            write_table(table, f)
+    else:
+        write_table(table, sys.stdout)
+    del prev
+    rom.close()
@@ -0,0 +1,273 @@
+#!/usr/bin/python3
+
+# sm83 is a recursive-descent disassembler for Game Boy (SM83) code, used by
+# gbd's code format.  Opcodes are decoded through two precomputed 256-entry
+# tables (plain and CB-prefixed) rather than if-chains.  Tracing follows jumps,
+# calls and rsts from the given entry points, resolves 4000-7FFF targets
+# against whichever bank is mapped (including banks set by a literal
+# ld a, n / ld [$2000-$3fff], a pair), and shares one visited map across all
+# entry points, so code reached from several places is decoded once.
+#
+#   from sm83 import Disassembler
+#   dis = Disassembler(rom, symbols)
+#   dis.add_entry(0x06, 0x50df, "State00Enter")
+#   dis.trace()
+#   print("\n".join(dis.listing()))
+
+import re
+
+from romimage import absp, relp
+
+REGISTERS = ["b", "c", "d", "e", "h", "l", "[hl]", "a"]
+ALU = ["add a,", "adc a,", "sub", "sbc a,", "and", "xor", "or", "cp"]
+
+IRREGULAR = {
+    0x00: "nop", 0x01: "ld bc, {d16}", 0x02: "ld [bc], a", 0x03: "inc bc",
+    0x07: "rlca", 0x08: "ld [{a16}], sp", 0x09: "add hl, bc", 0x0a: "ld a, [bc]",
+    0x0b: "dec bc", 0x0f: "rrca",
+    0x10: "stop", 0x11: "ld de, {d16}", 0x12: "ld [de], a", 0x13: "inc de",
+    0x17: "rla", 0x18: "jr {r8}", 0x19: "add hl, de", 0x1a: "ld a, [de]",
+    0x1b: "dec de", 0x1f: "rra",
+    0x20: "jr nz, {r8}", 0x21: "ld hl, {d16}", 0x22: "ld [hli], a", 0x23: "inc hl",
+    0x27: "daa", 0x28: "jr z, {r8}", 0x29: "add hl, hl", 0x2a: "ld a, [hli]",
+    0x2b: "dec hl", 0x2f: "cpl",
+    0x30: "jr nc, {r8}", 0x31: "ld sp, {d16}", 0x32: "ld [hld], a", 0x33: "inc sp",
+    0x37: "scf", 0x38: "jr c, {r8}", 0x39: "add hl, sp", 0x3a: "ld a, [hld]",
+    0x3b: "dec sp", 0x3f: "ccf",
+    0x76: "halt",
+    0xc0: "ret nz", 0xc1: "pop bc", 0xc2: "jp nz, {a16}", 0xc3: "jp {a16}",
+    0xc4: "call nz, {a16}", 0xc5: "push bc", 0xc8: "ret z", 0xc9: "ret",
+    0xca: "jp z, {a16}", 0xcc: "call z, {a16}", 0xcd: "call {a16}",
+    0xd0: "ret nc", 0xd1: "pop de", 0xd2: "jp nc, {a16}", 0xd4: "call nc, {a16}",
+    0xd5: "push de", 0xd8: "ret c", 0xd9: "reti", 0xda: "jp c, {a16}",
+    0xdc: "call c, {a16}",
+    0xe0: "ldh [{a8}], a", 0xe1: "pop hl", 0xe2: "ldh [c], a", 0xe5: "push hl",
+    0xe8: "add sp, {e8}", 0xe9: "jp hl", 0xea: "ld [{a16}], a",
+    0xf0: "ldh a, [{a8}]", 0xf1: "pop af", 0xf2: "ldh a, [c]", 0xf3: "di",
+    0xf5: "push af", 0xf8: "ld hl, sp{e8}", 0xf9: "ld sp, hl", 0xfa: "ld a, [{a16}]",
+    0xfb: "ei",
+}
+
+OPERAND_SIZE = {"d8": 1, "a8": 1, "r8": 1, "e8": 1, "d16": 2, "a16": 2}
+
+WRITES_A = re.compile(r"^(ldh? a,|add a,|adc a,|sbc a,|sub |and |xor |or |inc a$|dec a$|"
+                      r"rlca|rla|rrca|rra|daa|cpl|pop af|(rlc|rrc|rl|rr|sla|sra|swap|srl|res \d,|set \d,) a$)")
+
+class Opcode(object):
+    __slots__ = ("template", "length", "operand", "flow", "conditional", "writes_a")
+
+    def __init__(self, template, prefixed=False):
+        self.template = template
+        operand = re.search(r"\{(\w+)\}", template)
+        self.operand = operand.group(1) if operand else None
+        self.length = 1 + prefixed + OPERAND_SIZE.get(self.operand, 0) + (template == "stop")
+        mnemonic = template.split()[0]
+        self.conditional = "," in template and mnemonic in ("jp", "jr", "call") or template.startswith("ret ")
+        if template == "jp hl":
+            self.flow = "end"
+        elif mnemonic in ("jp", "jr", "call", "rst"):
+            self.flow = mnemonic
+        elif mnemonic in ("ret", "reti"):
+            self.flow = "end"
+        elif mnemonic == "db":
+            self.flow = "end"
+        else:
+            self.flow = None
+        self.writes_a = bool(WRITES_A.match(template))
+
+def _build_tables():
+    main = [None] * 256
+    for op, template in IRREGULAR.items():
+        main[op] = template
+    for i, r in enumerate(REGISTERS):
+        main[0x04 + i*8] = f"inc {r}"
+        main[0x05 + i*8] = f"dec {r}"
+        main[0x06 + i*8] = f"ld {r}, {{d8}}"
+        main[0xc7 + i*8] = f"rst ${i*8:02x}"
+        main[0xc6 + i*8] = f"{ALU[i]} {{d8}}"
+        for j, s in enumerate(REGISTERS):
+            if 0x40 + i*8 + j != 0x76:
+                main[0x40 + i*8 + j] = f"ld {r}, {s}"
+            main[0x80 + i*8 + j] = f"{ALU[i]} {s}"
+    for op in range(256):
+        if main[op] is None:
+            main[op] = f"db ${op:02x}"
+    main[0xcb] = "prefix"
+
+    cb = [None] * 256
+    rotations = ["rlc", "rrc", "rl", "rr", "sla", "sra", "swap", "srl"]
+    for op in range(256):
+        r = REGISTERS[op & 7]
+        group, n = op >> 6, (op >> 3) & 7
+        if group == 0:
+            cb[op] = f"{rotations[n]} {r}"
+        else:
+            cb[op] = f"{['', 'bit', 'res', 'set'][group]} {n}, {r}"
+    return [Opcode(t) for t in main], [Opcode(t, prefixed=True) for t in cb]
+
+OPCODES, CB_OPCODES = _build_tables()
+
+class Instruction(object):
+    __slots__ = ("address", "bank", "pointer", "opcode", "value", "target", "destination")
+
+    def __init__(self, address, bank, pointer, opcode, value, target, destination):
+        self.address = address
+        self.bank = bank
+        self.pointer = pointer
+        self.opcode = opcode
+        self.value = value
+        self.target = target
+        # Linear address of the target, if the mapped bank was known.
+        self.destination = destination
+
+class Disassembler(object):
+    def __init__(self, rom, symbols=None):
+        self.rom = rom
+        self.data = rom.data
+        self.symbols = symbols
+        self.visited = bytearray(len(rom))
+        self.instructions = {}
+        self.labels = {}
+        # Addresses named by add_entry, and any further names they were given.
+        self.named = set()
+        self.aliases = {}
+        self.queue = []
+
+    def add_entry(self, bank, pointer, name=None):
+        address = absp(bank, pointer)
+        if name and address in self.named:
+            # Several table entries sharing a handler; the first name stays.
+            if name != self.labels[address] and name not in self.aliases.setdefault(address, []):
+                self.aliases[address].append(name)
+        elif name:
+            self.labels[address] = name
+            self.named.add(address)
+        elif address not in self.labels:
+            self.labels[address] = self.auto_label(address, "Call")
+        # Whatever bank the table gives is mapped while the entry runs, even
+        # when the entry itself is in the home bank.
+        self.queue.append((address, bank or None))
+
+    def auto_label(self, address, kind):
+        bank, pointer = relp(address)
+        name = self.symbols.label(bank, pointer) if self.symbols else None
+        return name or f"{kind}_{bank:02x}_{pointer:04x}"
+
+    def decode(self, address):
+        op = self.data[address]
+        opcode = OPCODES[op]
+        if opcode.template == "prefix":
+            opcode = CB_OPCODES[self.data[address+1]]
+            return opcode, None
+        size = OPERAND_SIZE.get(opcode.operand, 0)
+        if size == 1:
+            value = self.data[address+1]
+        elif size == 2:
+            value = self.data[address+1] | (self.data[address+2] << 8)
+        else:
+            value = None
+        return opcode, value
+
+    def resolve(self, pointer, mapped):
+        # Linear address of a code pointer given the mapped bank, or None.
+        if pointer < 0x4000:
+            return pointer
+        if pointer < 0x8000 and mapped:
+            address = absp(mapped, pointer)
+            if address < len(self.rom):
+                return address
+        return None
+
+    def trace(self):
+        size = len(self.rom)
+        while self.queue:
+            address, mapped = self.queue.pop()
+            a = None
+            while 0 <= address < size and not self.visited[address]:
+                op = self.data[address]
+                # The prefix byte counts for one; the instruction it starts is two.
+                if address + OPCODES[op].length + (op == 0xcb) > size:
+                    break
+                opcode, value = self.decode(address)
+                bank, pointer = relp(address)
+                if mapped is None and address >= 0x4000:
+                    mapped = bank
+
+                target = None
+                if opcode.operand == "r8":
+                    target = (pointer + 2 + (value - 256 if value > 127 else value)) & 0xffff
+                elif opcode.flow in ("jp", "call") and opcode.operand == "a16":
+                    target = value
+                elif opcode.flow == "rst":
+                    target = int(opcode.template.split("$")[1], 16)
+
+                destination = self.resolve(target, mapped) if target is not None else None
+                self.visited[address] = 1
+                self.instructions[address] = Instruction(address, bank, pointer, opcode, value, target, destination)
+
+                if destination is not None:
+                    if destination not in self.labels:
+                        kind = "Call" if opcode.flow in ("call", "rst") else "Jump"
+                        self.labels[destination] = self.auto_label(destination, kind)
+                    self.queue.append((destination, mapped))
+
+                # Track literal bank switches: ld a, n / ld [$2000-$3fff], a.
+                if opcode.template == "ld a, {d8}":
+                    a = value
+                elif opcode.template == "ld [{a16}], a" and 0x2000 <= value < 0x4000 and a is not None:
+                    mapped = a or 1
+                elif opcode.writes_a or opcode.flow == "call":
+                    a = None
+
+                if opcode.flow in ("end", "jp", "jr") and not opcode.conditional:
+                    break
+                address += opcode.length
+
+    def operand(self, instruction):
+        kind, value = instruction.opcode.operand, instruction.value
+        mapped = instruction.bank if instruction.address >= 0x4000 else 0
+        if instruction.target is not None and kind in ("r8", "a16"):
+            if instruction.destination in self.labels:
+                return self.labels[instruction.destination]
+            return f"${instruction.target:04x}"
+        if kind == "d8":
+            return f"${value:02x}"
+        if kind == "a8":
+            name = self.symbols.label(0, 0xff00 + value) if self.symbols else None
+            return name or f"$ff{value:02x}"
+        if kind == "e8":
+            signed = value - 256 if value > 127 else value
+            return f"{signed:+d}" if "sp{" in instruction.opcode.template else f"{signed}"
+        if kind in ("d16", "a16"):
+            name = None
+            if self.symbols:
+                name = self.symbols.label(mapped if 0x4000 <= value < 0x8000 else 0, value)
+            return name or f"${value:04x}"
+        return ""
+
+    def text(self, instruction):
+        template = instruction.opcode.template
+        if instruction.opcode.operand:
+            template = template.replace("{" + instruction.opcode.operand + "}", self.operand(instruction))
+        return template
+
+    def listing(self):
+        lines = []
+        end = None
+        for address in sorted(self.instructions):
+            instruction = self.instructions[address]
+            if end is not None and address != end:
+                lines.append("")
+            if address in self.labels:
+                lines.append(f"{self.labels[address]}: ; {instruction.bank:02x}:{instruction.pointer:04x}")
+                for alias in self.aliases.get(address, []):
+                    lines.append(f"; also {alias}")
+            lines.append(f"    {self.text(instruction)}")
+            end = address + instruction.opcode.length
+        return lines
+
+    def block_end(self, address):
+        # First address after the contiguous run of code starting at `address`.
+        while address in self.instructions:
+            address += self.instructions[address].opcode.length
+        return address
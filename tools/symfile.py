@@ -0,0 +1,137 @@
+#!/usr/bin/python3
+
+# symfile loads rgbds-style .sym files (hp1.sym, robopon.sym, ...) into per-bank
+# sorted address arrays, so "which label is this pointer in" is a bisect and
+# "where is this label" is a dict lookup.  The parsed table is pickled next to
+# the .sym file and reused for as long as the .sym file's mtime and size don't
+# change.
+#
+#   $ python3 symfile.py hp1.sym 06:50e8 State00Leave
+#   06:50e8 State00Init+3
+#   State00Leave 06:510c
+
+import os
+import pickle
+import re
+from array import array
+from bisect import bisect_right
+
+SYMBOL = re.compile(r"^\s*([0-9a-fA-F]+):([0-9a-fA-F]{1,4})\s+([^\s;]+)")
+
+CACHE_VERSION = 1
+
+class SymbolTable(object):
+    def __init__(self, symbols=()):
+        self.names = {}
+        self.banks = {}
+        byb = {}
+        for bank, pointer, name in symbols:
+            if pointer < 0x4000:
+                bank = 0
+            self.names.setdefault(name, (bank, pointer))
+            # The first label at an address is the one pointers get named after.
+            byb.setdefault(bank, {}).setdefault(pointer, name)
+        for bank, entries in byb.items():
+            pointers = sorted(entries)
+            self.banks[bank] = (array('H', pointers), [entries[p] for p in pointers])
+
+    @classmethod
+    def parse(cls, lines):
+        symbols = []
+        for line in lines:
+            match = SYMBOL.match(line)
+            if match:
+                bank, pointer, name = match.groups()
+                symbols.append((int(bank, 16), int(pointer, 16), name))
+        return cls(symbols)
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, name):
+        return name in self.names
+
+    def address(self, name):
+        return self.names[name]
+
+    def lookup(self, bank, pointer):
+        # Nearest label at or before bank:pointer, as (name, offset), or None.
+        # Home bank pointers are looked up in bank 0 regardless of `bank`.
+        if pointer < 0x4000:
+            bank = 0
+        if bank not in self.banks:
+            return None
+        pointers, names = self.banks[bank]
+        i = bisect_right(pointers, pointer) - 1
+        if i < 0:
+            return None
+        return names[i], pointer - pointers[i]
+
+    def label(self, bank, pointer):
+        # Exact label for bank:pointer, or None.
+        found = self.lookup(bank, pointer)
+        if found and found[1] == 0:
+            return found[0]
+        return None
+
+    def describe(self, bank, pointer):
+        found = self.lookup(bank, pointer)
+        if not found:
+            return None
+        name, offset = found
+        return f"{name}+{offset:x}" if offset else name
+
+_loaded = {}
+
+def load(path, cache=True):
+    # Parses `path`, going through the in-process table and the on-disk cache
+    # first.  Returns an empty table if the file doesn't exist.
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return SymbolTable()
+    key = (stat.st_mtime_ns, stat.st_size)
+    if path in _loaded and _loaded[path][0] == key:
+        return _loaded[path][1]
+
+    cache_path = path + ".cache"
+    table = None
+    if cache:
+        try:
+            with open(cache_path, "rb") as f:
+                version, cached_key, state = pickle.load(f)
+            if version == CACHE_VERSION and cached_key == key:
+                table = SymbolTable.__new__(SymbolTable)
+                table.__dict__.update(state)
+        except (OSError, EOFError, ValueError, pickle.UnpicklingError):
+            pass
+    if table is None:
+        with open(path, encoding="utf-8", errors="replace") as f:
+            table = SymbolTable.parse(f)
+        if cache:
+            try:
+                with open(cache_path, "wb") as f:
+                    pickle.dump((CACHE_VERSION, key, table.__dict__), f, pickle.HIGHEST_PROTOCOL)
+            except OSError:
+                pass
+    _loaded[path] = (key, table)
+    return table
+
+def symfile_for(rom_path):
+    # rgbds names the .sym after the ROM: game.gbc -> game.sym.  GBD_SYM wins.
+    return os.environ.get("GBD_SYM") or os.path.splitext(rom_path)[0] + ".sym"
+
+if __name__ == "__main__":
+    from sys import argv, exit
+    if len(argv) < 3:
+        exit("usage: symfile.py file.sym (bank:pointer|label)...")
+    symbols = load(argv[1])
+    for arg in argv[2:]:
+        if arg in symbols:
+            bank, pointer = symbols.address(arg)
+            print(f"{arg} {bank:02x}:{pointer:04x}")
+        elif ":" in arg:
+            bank, pointer = (int(x, 16) for x in arg.split(":"))
+            print(f"{bank:02x}:{pointer:04x} {symbols.describe(bank, pointer) or '?'}")
+        else:
+            print(f"{arg} ?")
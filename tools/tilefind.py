@@ -0,0 +1,132 @@
+#!/usr/bin/python3
+
+# tilefind looks for an image's tiles in ROMs and dumps: given a PNG (a
+# screenshot crop, or something gb2pgm/gba2png wrote), it encodes every 8x8
+# tile as GB 2bpp and GBA 4bpp/8bpp, flipped every which way, and reports
+# every place any of them occurs.  All the encodings are searched at once,
+# each looked up by its most varied eight-byte window (so a blank first row
+# doesn't match every run of zeros), in one pass per file however many tiles
+# and formats there are.
+#
+#   $ python3 tilefind.py title.png hm3.gbc g/ d/
+#   hm3.gbc 1c:5a40 2bpp tile 0
+#   hm3.gbc 1c:5a50 2bpp tile 1 hflip
+#   g/4bc12.bin 0x120 2bpp tile 3
+#
+# Paletted PNGs give color indices directly.  Otherwise colors are numbered
+# from lightest to darkest, which is right for GB shades and for gb2pgm's
+# output; gba2png's grays are undone by scaling.  Tiles of a single color
+# are skipped, since they match everywhere.
+
+import os
+import sys
+
+import numpy as np
+import png
+
+from gbaddr import gbswitch
+from romimage import RomImage
+import tiles
+
+FORMATS = ('2bpp', '4bpp', '8bpp')
+FLIPS = (('', lambda t: t), ('hflip', lambda t: t[:, :, ::-1]),
+         ('vflip', lambda t: t[:, ::-1, :]), ('hvflip', lambda t: t[:, ::-1, ::-1]))
+
+def read_image(path):
+    # (height, width) array of color indices.
+    width, height, rows, info = png.Reader(filename=path).read()
+    planes = info['planes']
+    pixels = np.array([list(row) for row in rows], dtype=np.int64).reshape(height, width, planes)
+    if 'palette' in info:
+        return pixels[:, :, 0].astype(np.uint8)
+    if planes in (1, 2):
+        gray = pixels[:, :, 0]
+        maxval = (1 << info['bitdepth']) - 1
+        if np.all(gray % 16 == 0) and maxval == 255:
+            # gba2png's 4bpp output.
+            return (gray // 16).astype(np.uint8)
+        if len(np.unique(gray)) <= 4:
+            # GB shades, white first.
+            return np.rint((maxval - gray) * 3 / maxval).astype(np.uint8)
+        return gray.astype(np.uint8)
+    # Colors, lightest first.
+    luma = pixels[:, :, 0] * 299 + pixels[:, :, 1] * 587 + pixels[:, :, 2] * 114
+    levels = np.unique(luma)
+    return (len(levels) - 1 - np.searchsorted(levels, luma)).astype(np.uint8)
+
+def image_tiles(image):
+    height, width = image.shape
+    height, width = height - height % 8, width - width % 8
+    return image[:height, :width].reshape(height // 8, 8, width // 8, 8).transpose(0, 2, 1, 3).reshape(-1, 8, 8)
+
+def patterns(query):
+    # {encoded bytes: [(format, tile, flip)]} for every tile, format and flip.
+    found = {}
+    colors = query.reshape(len(query), -1).max(axis=1)
+    uniform = query.reshape(len(query), -1).min(axis=1) == colors
+    for format in FORMATS:
+        limit = {'2bpp': 4, '4bpp': 16, '8bpp': 256}[format]
+        for name, flip in FLIPS:
+            encoded = tiles.TileSet(flip(query)).encode(format)
+            size = tiles.TILE_BYTES[format]
+            for i in range(len(query)):
+                if uniform[i] or colors[i] >= limit:
+                    continue
+                found.setdefault(encoded[i*size:(i+1)*size], []).append((format, i, name))
+    return found
+
+def anchor(pattern):
+    # Where in the pattern to look it up from: the eight-byte window with the
+    # most different bytes.  A blank first row would otherwise match every
+    # run of zeros in the ROM.
+    return max(range(len(pattern) - 7), key=lambda k: len(set(pattern[k:k+8])))
+
+def search(data, table):
+    # Every (offset, pattern) in data.  Each offset's eight bytes are read as
+    # one integer and looked up in the patterns' anchor windows.
+    windows = {}
+    for pattern in table:
+        k = anchor(pattern)
+        windows.setdefault(pattern[k:k+8], []).append((k, pattern))
+    keys = np.frombuffer(b''.join(windows), dtype='<u8')
+    found = []
+    for phase in range(8):
+        n = (len(data) - phase) // 8
+        if n <= 0:
+            continue
+        words = np.frombuffer(data, dtype='<u8', count=n, offset=phase)
+        for index in np.flatnonzero(np.isin(words, keys)):
+            offset = phase + 8 * int(index)
+            for k, pattern in windows[bytes(data[offset:offset+8])]:
+                start = offset - k
+                if start >= 0 and bytes(data[start:start+len(pattern)]) == pattern:
+                    found.append((start, pattern))
+    return sorted(found)
+
+def files(paths):
+    for path in paths:
+        if os.path.isdir(path):
+            for f in sorted(os.listdir(path)):
+                full = os.path.join(path, f)
+                if os.path.isfile(full) and not f.startswith('.') and f[-4:] not in ('.png', '.pgm', '.ppm'):
+                    yield full
+        else:
+            yield path
+
+if __name__ == '__main__':
+    if len(sys.argv) < 3:
+        sys.exit('usage: python3 tilefind.py image.png rom.gbc|dump|directory...')
+    query = image_tiles(read_image(sys.argv[1]))
+    table = patterns(query)
+    if not table:
+        sys.exit('No tiles worth looking for in {}'.format(sys.argv[1]))
+    for path in files(sys.argv[2:]):
+        if not os.path.getsize(path):
+            continue
+        rom = RomImage(path)
+        gb = path.lower().endswith(('.gb', '.gbc'))
+        for offset, pattern in search(rom.data, table):
+            where = gbswitch(offset) if gb else hex(offset)
+            for format, tile, flip in table[pattern]:
+                print(' '.join(filter(None, (path, where, format, 'tile', str(tile), flip))))
+        rom.close()
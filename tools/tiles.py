@@ -0,0 +1,145 @@
+#!/usr/bin/python3
+
+# tiles decodes and encodes 8x8 tile graphics:
+#
+#   1bpp  GB 1bpp, one byte per row
+#   2bpp  GB 2bpp planar, two bytes per row (low plane first)
+#   4bpp  GBA 4bpp linear, two pixels per byte (left pixel in the low nibble)
+#   8bpp  GBA 8bpp linear, or any other one-byte-per-pixel indexed format
+#
+# A TileSet keeps its tiles in one contiguous (n, 8, 8) uint8 array of color
+# indices, 64 bytes a tile, and lays them out into images for the converters.
+#
+#   tileset = tiles.decode(data, '2bpp')
+#   image = tileset.arrange(16)                # 16 tiles to a row
+#   image = tileset.arrange_blocks(6, 4, 8)    # 6x4 sprites, 8 to a row
+#   for band in tiles.bands(data, '4bpp', 16): # 8 pixel rows at a time
+#   rgb = tiles.palettes(data)[0][image]       # through a BGR555 palette
+
+import numpy as np
+
+TILE_BYTES = {'1bpp': 8, '2bpp': 16, '4bpp': 32, '8bpp': 64}
+
+# Left and right pixel of every 4bpp byte.
+NIBBLES = np.stack([np.arange(256) & 0x0f, np.arange(256) >> 4], axis=1).astype(np.uint8)
+
+# RGB for every BGR555 color (GBC and GBA palettes), each component shifted
+# up by 3.
+_colors = np.arange(0x8000)
+BGR555 = np.stack([(_colors & 31) << 3, ((_colors >> 5) & 31) << 3, (_colors >> 10) << 3],
+                  axis=1).astype(np.uint8)
+
+def palettes(data, colors=4):
+    # (n, colors, 3) RGB palettes from bytes-like BGR555 data.
+    words = np.frombuffer(data, dtype='<u2')
+    return BGR555[words & 0x7fff].reshape(-1, colors, 3)
+
+def _decode_1bpp(raw):
+    return np.unpackbits(raw.reshape(-1, 8, 1), axis=2)
+
+def _decode_2bpp(raw):
+    bits = np.unpackbits(raw.reshape(-1, 8, 2), axis=2)
+    return bits[:, :, :8] | (bits[:, :, 8:] << 1)
+
+def _decode_4bpp(raw):
+    return NIBBLES[raw.reshape(-1, 8, 4)].reshape(-1, 8, 8)
+
+def _decode_8bpp(raw):
+    return raw.reshape(-1, 8, 8)
+
+def _encode_1bpp(pixels):
+    return np.packbits(pixels & 1, axis=2)
+
+def _encode_2bpp(pixels):
+    return np.concatenate([np.packbits(pixels & 1, axis=2),
+                           np.packbits((pixels >> 1) & 1, axis=2)], axis=2)
+
+def _encode_4bpp(pixels):
+    return (pixels[:, :, 0::2] & 0x0f) | (pixels[:, :, 1::2] << 4)
+
+def _encode_8bpp(pixels):
+    return pixels
+
+DECODERS = {'1bpp': _decode_1bpp, '2bpp': _decode_2bpp, '4bpp': _decode_4bpp, '8bpp': _decode_8bpp}
+ENCODERS = {'1bpp': _encode_1bpp, '2bpp': _encode_2bpp, '4bpp': _encode_4bpp, '8bpp': _encode_8bpp}
+
+class TileSet(object):
+    def __init__(self, pixels):
+        self.pixels = np.ascontiguousarray(pixels, dtype=np.uint8).reshape(-1, 8, 8)
+
+    def __len__(self):
+        return len(self.pixels)
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return TileSet(self.pixels[key])
+        return self.pixels[key]
+
+    def encode(self, format):
+        return ENCODERS[format](self.pixels).astype(np.uint8).tobytes()
+
+    def arrange(self, width, fill=0):
+        # Image with the tiles laid out `width` to a row, left to right, top to
+        # bottom; the last row is padded with `fill`.
+        count = -(-len(self) // width) * width
+        padded = np.full((count, 8, 8), fill, dtype=np.uint8)
+        padded[:len(self)] = self.pixels
+        return padded.reshape(-1, width, 8, 8).transpose(0, 2, 1, 3).reshape(-1, width*8)
+
+    def arrange_blocks(self, block_width, block_height, per_row, fill=0, column_major=False):
+        # Image of consecutive block_width x block_height tile blocks (sprites),
+        # `per_row` blocks to a row.  Tiles within a block are row-major unless
+        # column_major is set.
+        size = block_width*block_height
+        count = -(-len(self) // (size*per_row)) * size*per_row
+        padded = np.full((count, 8, 8), fill, dtype=np.uint8)
+        padded[:len(self)] = self.pixels
+        if column_major:
+            blocks = padded.reshape(-1, block_width, block_height, 8, 8).transpose(0, 2, 1, 3, 4)
+        else:
+            blocks = padded.reshape(-1, block_height, block_width, 8, 8)
+        # (block row, block col, tile row, pixel row, tile col, pixel col)
+        blocks = blocks.reshape(-1, per_row, block_height, block_width, 8, 8).transpose(0, 2, 4, 1, 3, 5)
+        return blocks.reshape(-1, per_row*block_width*8)
+
+# Flips by number, as in tilemap attributes: bit 0 is horizontal, bit 1 vertical.
+FLIPS = (lambda p: p, lambda p: p[:, :, ::-1], lambda p: p[:, ::-1, :], lambda p: p[:, ::-1, ::-1])
+
+def dedupe(tileset, flips=False):
+    # Unique tiles in order of first use, plus each tile's index among them
+    # and the flip that turns that unique tile back into it.  With flips, a
+    # tile and its mirror images count as one.
+    pixels = tileset.pixels
+    variants = np.stack([flip(pixels) for flip in (FLIPS if flips else FLIPS[:1])])
+    flat = variants.reshape(len(variants), len(pixels), 64)
+    # A tile's canonical form is whichever of its flips hashes lowest; all
+    # flips of a tile share the same four hashes, so they agree on it.
+    words = flat.view('<u8').astype(np.uint64)
+    weights = np.array([0x9e3779b97f4a7c15 * (2*i + 1) & 0xffffffffffffffff for i in range(8)], dtype=np.uint64)
+    hashes = (words * weights).sum(axis=2)
+    choice = hashes.argmin(axis=0)
+    canonical = flat[choice, np.arange(len(pixels))]
+    _, first, inverse = np.unique(canonical, axis=0, return_index=True, return_inverse=True)
+    inverse = inverse.reshape(-1)
+    # Number the unique tiles by first use rather than by sort order.
+    order = np.argsort(first, kind='stable')
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+    unique = TileSet(canonical[first[order]])
+    return unique, rank[inverse], choice.astype(np.uint8)
+
+def bands(data, format, width, fill=0):
+    # Decodes `data` one row of `width` tiles at a time, yielding (8, width*8)
+    # images, so a whole sheet never has to be in memory at once.
+    view = memoryview(data)
+    band = TILE_BYTES[format]*width
+    end = len(view) - len(view) % TILE_BYTES[format]
+    for start in range(0, end, band):
+        yield decode(view[start:min(start+band, end)], format).arrange(width, fill)
+
+def decode(data, format, count=None):
+    # TileSet from bytes-like `data`; a trailing partial tile is dropped.
+    size = TILE_BYTES[format]
+    raw = np.frombuffer(data, dtype=np.uint8)
+    n = len(raw) // size if count is None else min(count, len(raw) // size)
+    return TileSet(DECODERS[format](raw[:n*size]))
@@ -0,0 +1,204 @@
+#!/usr/bin/python3
+
+# tileview is a tile viewer in the browser, for when you don't know where the
+# graphics are yet.  It maps the ROM and renders whatever is asked for on the
+# fly:
+#
+#   $ python3 tileview.py hm3.gbc [port]
+#   Serving hm3.gbc on http://localhost:8083/
+#
+# The page scrolls through the ROM with the keyboard:
+#
+#   up/down        one row of tiles       pgup/pgdn  one screen
+#   left/right     one byte               [ ]        one tile
+#   - +            narrower/wider         b          next bpp (1, 2, 4, 8)
+#   g              go to an offset (hex or bank:pointer)
+#
+# Images are /rom/<offset>/<bpp>/<width>.png?rows=<rows>, with the offset in
+# hex.  Decoded rows of tiles are kept in an LRU cache, so scrolling a screen
+# down only decodes the rows that weren't on it before.
+
+import json
+import struct
+import sys
+import zlib
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+
+from romimage import RomImage
+import tiles
+
+PORT = 8083
+MAX_ROWS = 256
+MAX_WIDTH = 64
+
+rom = None
+
+@lru_cache(maxsize=4096)
+def band(offset, format, width):
+    # One row of `width` tiles at `offset`, or None past the end of the ROM.
+    size = tiles.TILE_BYTES[format]*width
+    if offset >= len(rom):
+        return None
+    data = rom.view(offset, min(size, len(rom) - offset))
+    image = tiles.decode(data, format).arrange(width) if len(data) >= tiles.TILE_BYTES[format] else None
+    if image is not None:
+        image.flags.writeable = False
+    return image
+
+def render(offset, bpp, width, rows):
+    format = '{}bpp'.format(bpp)
+    size = tiles.TILE_BYTES[format]*width
+    image = np.zeros((rows*8, width*8), dtype=np.uint8)
+    for row in range(rows):
+        pixels = band(offset + row*size, format, width)
+        if pixels is None:
+            break
+        image[row*8:row*8+8] = pixels
+    # Color 0 is the lightest, as on the GB.
+    return 255 - image * (255 // ((1 << bpp) - 1))
+
+def png(image):
+    height, width = image.shape
+    def chunk(kind, data):
+        return (struct.pack('>I', len(data)) + kind + data +
+                struct.pack('>I', zlib.crc32(kind + data) & 0xffffffff))
+    # Filter byte 0 (none) in front of every row.
+    raw = np.zeros((height, width+1), dtype=np.uint8)
+    raw[:, 1:] = image
+    return (b'\x89PNG\r\n\x1a\n' +
+            chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 0, 0, 0, 0)) +
+            chunk(b'IDAT', zlib.compress(raw.tobytes(), 1)) +
+            chunk(b'IEND', b''))
+
+PAGE = '''<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>tileview</title>
+<style>
+body { background: #333; color: #ddd; font-family: monospace; margin: 8px; }
+img { image-rendering: pixelated; display: block; margin-top: 8px; background: #f0f; }
+</style></head>
+<body>
+<div id="status"></div>
+<img id="view">
+<script>
+var info = INFO;
+var state = {offset: 0, bpp: 2, width: 16, scale: 3};
+var bpps = [1, 2, 4, 8];
+var tileBytes = {1: 8, 2: 16, 4: 32, 8: 64};
+var view = document.getElementById("view");
+var statusLine = document.getElementById("status");
+var preload = new Image();
+
+function rows() {
+    return Math.max(1, Math.min(MAX_ROWS, Math.floor((window.innerHeight - 40) / (8*state.scale))));
+}
+function rowBytes() { return tileBytes[state.bpp] * state.width; }
+function url(offset) {
+    return "/rom/" + offset.toString(16) + "/" + state.bpp + "/" + state.width + ".png?rows=" + rows();
+}
+function gb(offset) {
+    var bank = Math.floor(offset / 0x4000), pointer = offset % 0x4000 + (bank ? 0x4000 : 0);
+    return ("0" + bank.toString(16)).slice(-2) + ":" + ("000" + pointer.toString(16)).slice(-4);
+}
+function update() {
+    var screen = rows() * rowBytes();
+    state.offset = Math.max(0, Math.min(state.offset, info.size - 1));
+    view.src = url(state.offset);
+    view.style.width = (state.width * 8 * state.scale) + "px";
+    // Warm the server's cache for the next screen down.
+    preload.src = url(state.offset + screen);
+    statusLine.textContent = info.name + "  " + state.offset.toString(16) + " (" + gb(state.offset) + ")  " +
+        state.bpp + "bpp  " + state.width + " wide";
+    location.hash = state.offset.toString(16) + "/" + state.bpp + "/" + state.width;
+}
+document.addEventListener("keydown", function (e) {
+    var screen = rows() * rowBytes();
+    switch (e.key) {
+    case "ArrowDown": state.offset += rowBytes(); break;
+    case "ArrowUp": state.offset -= rowBytes(); break;
+    case "PageDown": state.offset += screen; break;
+    case "PageUp": state.offset -= screen; break;
+    case "ArrowRight": state.offset += 1; break;
+    case "ArrowLeft": state.offset -= 1; break;
+    case "]": state.offset += tileBytes[state.bpp]; break;
+    case "[": state.offset -= tileBytes[state.bpp]; break;
+    case "+": case "=": state.width = Math.min(MAX_WIDTH, state.width + 1); break;
+    case "-": state.width = Math.max(1, state.width - 1); break;
+    case "b": state.bpp = bpps[(bpps.indexOf(state.bpp) + 1) % bpps.length]; break;
+    case "g":
+        var to = prompt("Offset (hex or bank:pointer)", state.offset.toString(16));
+        if (to && to.indexOf(":") >= 0) {
+            var parts = to.split(":"), bank = parseInt(parts[0], 16), pointer = parseInt(parts[1], 16);
+            state.offset = bank ? bank * 0x4000 + pointer - 0x4000 : pointer;
+        } else if (to) {
+            state.offset = parseInt(to, 16);
+        }
+        break;
+    default: return;
+    }
+    e.preventDefault();
+    update();
+});
+if (location.hash) {
+    var parts = location.hash.slice(1).split("/");
+    state.offset = parseInt(parts[0], 16) || 0;
+    state.bpp = parseInt(parts[1]) || 2;
+    state.width = parseInt(parts[2]) || 16;
+}
+window.addEventListener("resize", update);
+update();
+</script>
+</body></html>
+'''
+
+class Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        url = urlparse(self.path)
+        parts = url.path.strip('/').split('/')
+        if url.path == '/':
+            info = json.dumps({'name': rom.path, 'size': len(rom)})
+            page = PAGE.replace('INFO', info).replace('MAX_ROWS', str(MAX_ROWS)).replace('MAX_WIDTH', str(MAX_WIDTH))
+            self.send(200, 'text/html; charset=utf-8', page.encode())
+        elif len(parts) == 4 and parts[0] == 'rom' and parts[3].endswith('.png'):
+            try:
+                offset = int(parts[1], 16)
+                bpp = int(parts[2])
+                width = int(parts[3][:-4])
+                rows = int(parse_qs(url.query).get('rows', ['32'])[0])
+            except ValueError:
+                self.send(400, 'text/plain', b'Bad image request')
+                return
+            if bpp not in (1, 2, 4, 8) or not 0 < width <= MAX_WIDTH or not 0 < rows <= MAX_ROWS:
+                self.send(400, 'text/plain', b'Bad image request')
+                return
+            if not 0 <= offset < len(rom):
+                self.send(404, 'text/plain', b'Offset outside the ROM')
+                return
+            self.send(200, 'image/png', png(render(offset, bpp, width, rows)))
+        else:
+            self.send(404, 'text/plain', b'Not found')
+
+    def send(self, status, kind, body):
+        self.send_response(status)
+        self.send_header('Content-Type', kind)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+if __name__ == '__main__':
+    if len(sys.argv) not in (2, 3):
+        sys.exit('usage: python3 tileview.py rom.gbc [port]')
+    rom = RomImage(sys.argv[1])
+    port = int(sys.argv[2]) if len(sys.argv) > 2 else PORT
+    server = ThreadingHTTPServer(('localhost', port), Handler)
+    print('Serving {} on http://localhost:{}/'.format(sys.argv[1], port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass